@@ -0,0 +1,252 @@
+# aim_preview.py
+
+import array
+import threading
+import collections
+
+from math2d_vector import Vector
+from shot_cache import shot_config
+
+def _point_from_data(point):
+    if point is None:
+        return None
+    x, y = point
+    return (float(x), float(y))
+
+class AimPreview(object):
+    # What a shot is expected to do, for drawing over the table while aiming.  Points are
+    # (x, y) pairs.  The cue path grows while the preview is being worked out, and the rest
+    # is filled in as it happens, so a preview can be drawn before it is complete.  It is
+    # only complete once the shot has come to rest; one cut short by the time limit isn't.
+
+    __slots__ = [
+        'angle',
+        'speed',
+        'cue_path',
+        'first_contact',
+        'contact_point',
+        'object_ball_position',
+        'object_ball_direction',
+        'cushion_point',
+        'complete'
+    ]
+
+    def __init__(self, angle, speed):
+        self.angle = angle
+        self.speed = speed
+        self.cue_path = []
+        self.first_contact = None
+        self.contact_point = None
+        self.object_ball_position = None
+        self.object_ball_direction = None
+        self.cushion_point = None
+        self.complete = False
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def to_data(self):
+        # As plain data for the shot cache, which from_data turns back into a preview.
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_data(cls, data):
+        angle, speed, cue_path, first_contact, contact_point, object_ball_position, object_ball_direction, cushion_point, complete = data
+        preview = cls(float(angle), float(speed))
+        preview.cue_path = [_point_from_data(point) for point in cue_path]
+        preview.first_contact = None if first_contact is None else int(first_contact)
+        preview.contact_point = _point_from_data(contact_point)
+        preview.object_ball_position = _point_from_data(object_ball_position)
+        preview.object_ball_direction = _point_from_data(object_ball_direction)
+        preview.cushion_point = _point_from_data(cushion_point)
+        preview.complete = bool(complete)
+        return preview
+
+class AimPreviewWorker(object):
+    # Works out aim previews on a thread of its own, by simulating the shot to rest on a
+    # table of its own, so that drawing never waits on a prediction.  Aims are quantized,
+    # and finished previews are cached by quantized aim until the table state changes, so
+    # holding the cue still, or coming back to an earlier aim, costs nothing.  Only the most
+    # recently requested aim is ever worked on: asking for a different one cancels whatever
+    # is being worked out, at the end of its current frame, and replaces anything waiting.
+    # Until the requested preview is ready, we hand back the last one we had, which is for
+    # a nearby aim while the player turns the cue.  The given table belongs to the worker.
+    # If a shot cache is given, finished previews are kept in it too, and looked up in it
+    # before being worked out.  Unless a simulator is given, the shot is run on the table's
+    # own fixed-step path, a frame of the given time step at a time, just as the physics
+    # thread runs the game, so the preview follows the same physics as the shot will.
+
+    def __init__(self, pool_table, simulator=None, angle_step=0.002, speed_step=0.05, max_time=60.0, time_step=1.0 / 60.0, settle_epsilon=1e-2, cache_size=256, shot_cache=None):
+        self.pool_table = pool_table
+        self.simulator = simulator
+        self.angle_step = angle_step
+        self.speed_step = speed_step
+        self.max_time = max_time
+        self.time_step = time_step
+        self.settle_epsilon = settle_epsilon
+        self.cache_size = cache_size
+        self.shot_cache = shot_cache
+        self.cache = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.state_data = None
+        self.pending = None
+        self.working_key = None
+        self.generation = 0
+        self.latest_preview = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            with self.condition:
+                self.running = False
+                self.generation += 1
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+
+    def quantize(self, angle, speed):
+        return int(round(angle / self.angle_step)), int(round(speed / self.speed_step))
+
+    def is_busy(self):
+        return self.pending is not None or self.working_key is not None
+
+    def request(self, state, angle, speed):
+        # Ask for the preview of the given aim from the given table state, and return the
+        # best preview we have right now, which may be None.  This never waits on the worker.
+        key = self.quantize(angle, speed)
+        with self.condition:
+            if self.state_data is None or self.state_data != state.data:
+                self.state_data = array.array('d', state.data)
+                self.cache.clear()
+                self.latest_preview = None
+                self.pending = None
+                self.generation += 1
+            preview = self.cache.get(key)
+            if preview is not None:
+                self.cache.move_to_end(key)
+                if self.working_key is not None and self.working_key != key:
+                    self.generation += 1
+                self.pending = None
+                self.latest_preview = preview
+                return preview
+            if key != self.working_key:
+                if self.working_key is not None:
+                    self.generation += 1
+                if self.pending is None or self.pending[0] != key:
+                    self.pending = (key, state)
+                    self.condition.notify()
+            return self.latest_preview
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                key, state = self.pending
+                self.pending = None
+                self.working_key = key
+                generation = self.generation
+                preview = AimPreview(key[0] * self.angle_step, key[1] * self.speed_step)
+                self.latest_preview = preview
+            finished = False
+            shot_key = None
+            try:
+                if self.shot_cache is not None:
+                    velocity = Vector(radius=preview.speed, angle=preview.angle)
+                    config = ('aim_preview', self.max_time, self.time_step, self.settle_epsilon) + shot_config(self.pool_table, self.simulator)
+                    shot_key = self.shot_cache.make_key(state, velocity.x, velocity.y, config)
+                    cached_preview = self.shot_cache.get(shot_key, AimPreview.from_data)
+                    if cached_preview is not None:
+                        preview = cached_preview
+                        finished = True
+                if not finished:
+                    finished = self._simulate(preview, state, generation)
+                    if finished and shot_key is not None:
+                        self.shot_cache.put(shot_key, preview.to_data())
+            except Exception as ex:
+                error = str(ex)
+            with self.condition:
+                self.working_key = None
+                if finished and generation == self.generation:
+                    self.latest_preview = preview
+                    self.cache[key] = preview
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+
+    def _load_state(self, state):
+        pool_table = self.pool_table
+        if tuple(ball.number for ball in pool_table.state_ball_list) != state.number_list:
+            pool_table.clear_balls()
+            for number in state.number_list:
+                pool_table.add_ball(number, Vector(0.0, 0.0))
+        pool_table.restore_state(state)
+
+    def _simulate(self, preview, state, generation):
+        # Returns false if the preview was cancelled before the shot came to rest.  The
+        # preview is marked complete if the shot came to rest within the time limit.
+        pool_table = self.pool_table
+        self._load_state(state)
+        cue_ball = pool_table.find_cue_ball()
+        if cue_ball is None:
+            preview.complete = True
+            return True
+        pool_table.strike_cue_ball(Vector(radius=preview.speed, angle=preview.angle))
+        position = cue_ball.position
+        preview.cue_path.append((position.x, position.y))
+        object_ball_list = []
+
+        def event_callback(event, intensity, ball=None, other_ball=None):
+            if event == 'ball_hit_ball' and preview.first_contact is None:
+                if ball.number == 0:
+                    cue_ball, object_ball = ball, other_ball
+                elif other_ball.number == 0:
+                    cue_ball, object_ball = other_ball, ball
+                else:
+                    return
+                position = cue_ball.position
+                preview.contact_point = (position.x, position.y)
+                preview.cue_path.append(preview.contact_point)
+                position = object_ball.position
+                preview.object_ball_position = (position.x, position.y)
+                object_ball_list.append(object_ball)
+                preview.first_contact = object_ball.number
+            elif event == 'ball_hit_bumper' and ball.number == 0 and preview.cushion_point is None:
+                position = ball.position
+                preview.cushion_point = (position.x, position.y)
+                preview.cue_path.append(preview.cushion_point)
+
+        def stop_condition():
+            # Called after every frame; we take the object ball's direction from the end of
+            # the frame it was hit in, once every contact in that frame has been resolved.
+            cue_ball = pool_table.find_cue_ball()
+            if cue_ball is not None:
+                position = cue_ball.position
+                preview.cue_path.append((position.x, position.y))
+            if preview.object_ball_direction is None and len(object_ball_list) > 0:
+                velocity = object_ball_list[0].velocity
+                if velocity.Length() > 0.0:
+                    velocity = velocity.Normalized()
+                    preview.object_ball_direction = (velocity.x, velocity.y)
+            return self.generation != generation
+
+        if self.simulator is not None:
+            self.simulator.simulate_to_rest(self.max_time, event_callback, stop_condition)
+            settled = self.simulator.is_settled()
+        else:
+            pool_table.simulate_to_rest(self.max_time, event_callback, stop_condition, self.time_step, self.settle_epsilon)
+            settled = pool_table.is_settled(self.settle_epsilon)
+        preview.complete = settled
+        return self.generation == generation
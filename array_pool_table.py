@@ -0,0 +1,89 @@
+# array_pool_table.py
+
+from ball_array import BallArray, ArrayContactFinder
+from pool_table import PoolTable
+
+class ArrayPoolTable(PoolTable):
+    # A pool table whose ball state lives in contiguous NumPy arrays.  The balls in
+    # ball_list are views into those arrays, so everything that works with a PoolTable
+    # still works here, but integration, friction and the max-speed and settled checks
+    # become single vectorized operations instead of per-ball Python loops.  So does the
+    # sweep for every contact at the start of a substep.  Everything else, from the grid
+    # and the pocket and cushion prefilters to the narrow phase, reads and writes a ball's
+    # state a row of the arrays at a time, and never goes through the ball's vectors.
+
+    def __init__(self, pocket_radius, ball_radius=None, cue_ball_mass=0.17, other_ball_mass=0.16, rng=None):
+        self.balls = BallArray()
+        super().__init__(pocket_radius, ball_radius, cue_ball_mass, other_ball_mass, rng)
+        self.ball_grid = ArrayContactFinder(self.balls, 2.0 * self.ball_radius)
+
+    def reset_balls(self):
+        self.balls.clear()
+        super().reset_balls()
+
+    def clear_balls(self):
+        self.balls.clear()
+        super().clear_balls()
+
+    def _create_ball(self, radius, mass, number):
+        return self.balls.create_ball(radius, mass, number)
+
+    def _integrate_balls(self, delta_time):
+        self.balls.integrate(delta_time)
+
+    def _apply_friction(self):
+        self.balls.scale_velocities(self.friction)
+
+    def _pocket_ball(self, ball):
+        super()._pocket_ball(ball)
+
+        # Pocketed balls stay in the arrays, so stop them here; that way they never
+        # move and never count towards the max speed.
+        self.balls.velocity[ball.index] = 0.0
+
+    def _calc_max_speed(self):
+        return self.balls.max_speed()
+
+    def _read_ball_state(self, ball):
+        return self.balls.state[ball.index].tolist()
+
+    def _write_ball_state(self, ball, x, y, velocity_x, velocity_y):
+        self.balls.state[ball.index] = (x, y, velocity_x, velocity_y)
+
+    def _balls_overlap(self, ball_a, ball_b, epsilon=1e-7):
+        state = self.balls.state
+        ax, ay, avx, avy = state[ball_a.index].tolist()
+        bx, by, bvx, bvy = state[ball_b.index].tolist()
+        dx = bx - ax
+        dy = by - ay
+        distance = ball_a.radius + ball_b.radius - epsilon
+        return dx * dx + dy * dy < distance * distance
+
+    def _select_pocket_candidates(self, ball_list, delta_time):
+        # Only a ball whose path leaves the pocket index's safe rectangle can have reached a
+        # pocket, and the rectangle is convex, so we just check both ends of every path.
+        pocket_index = self.pocket_index
+        min_x, min_y = pocket_index.safe_min_x, pocket_index.safe_min_y
+        max_x, max_y = pocket_index.safe_max_x, pocket_index.safe_max_y
+        row_list = self.balls.state.tolist()
+        candidate_list = []
+        for ball in ball_list:
+            x, y, velocity_x, velocity_y = row_list[ball.index]
+            start_x = x - velocity_x * delta_time
+            start_y = y - velocity_y * delta_time
+            if not (min_x < x < max_x and min_y < y < max_y and min_x < start_x < max_x and min_y < start_y < max_y):
+                candidate_list.append(ball)
+        return candidate_list
+
+    def _select_cushion_candidates(self, ball_list):
+        # A ball inside the cushion index's safe rectangle can't be touching any cushion.
+        cushion_index = self.cushion_index
+        min_x, min_y = cushion_index.safe_min_x, cushion_index.safe_min_y
+        max_x, max_y = cushion_index.safe_max_x, cushion_index.safe_max_y
+        row_list = self.balls.state.tolist()
+        candidate_list = []
+        for ball in ball_list:
+            x, y = row_list[ball.index][0:2]
+            if ball.radius > cushion_index.margin or not (min_x < x < max_x and min_y < y < max_y):
+                candidate_list.append(ball)
+        return candidate_list
@@ -0,0 +1,236 @@
+# ball_array.py
+
+import math
+
+import numpy
+
+from math2d_vector import Vector
+from spatial_grid import SpatialGrid
+
+class BallArray(object):
+    # Structure-of-arrays storage for ball state.  Row i of each array belongs to the
+    # ball whose index is i, and only the first count rows are in use.  The position and
+    # velocity arrays are views of the two halves of one state array, so that a ball's
+    # whole state can be read or written as a single row.
+
+    def __init__(self, capacity=16):
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.state = numpy.zeros((capacity, 4))
+        self.position = self.state[:, 0:2]
+        self.velocity = self.state[:, 2:4]
+        self.radius = numpy.zeros(capacity)
+        self.mass = numpy.zeros(capacity)
+        self.scratch = numpy.zeros((capacity, 2))
+
+    def capacity(self):
+        return self.state.shape[0]
+
+    def clear(self):
+        self.count = 0
+
+    def create_ball(self, radius, mass, number):
+        if self.count == self.capacity():
+            self._grow(2 * self.capacity())
+        index = self.count
+        self.count += 1
+        self.state[index] = 0.0
+        self.radius[index] = radius
+        self.mass[index] = mass
+        return ArrayBall(self, index, number)
+
+    def _grow(self, capacity):
+        count = self.count
+        state, radius, mass = self.state, self.radius, self.mass
+        self._allocate(capacity)
+        self.state[:count] = state[:count]
+        self.radius[:count] = radius[:count]
+        self.mass[:count] = mass[:count]
+
+    def integrate(self, delta_time):
+        count = self.count
+        scratch = self.scratch[:count]
+        numpy.multiply(self.velocity[:count], delta_time, out=scratch)
+        self.position[:count] += scratch
+
+    def scale_velocities(self, scale):
+        self.velocity[:self.count] *= scale
+
+    def max_speed(self):
+        if self.count == 0:
+            return 0.0
+        velocity = self.velocity[:self.count]
+        return float(numpy.sqrt(numpy.max(numpy.einsum('ij,ij->i', velocity, velocity))))
+
+class ArrayVector(Vector):
+    # A copy of a ball's position or velocity.  Changing a copy in place would change
+    # nothing on the ball, so it can't be changed at all; assign a new vector to the ball
+    # instead.  The augmented assignments make new vectors, so ball.position += delta
+    # still works, by way of the ball's setter.
+
+    def __init__(self, x, y):
+        object.__setattr__(self, 'x', x)
+        object.__setattr__(self, 'y', y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('A ball\'s vectors are copies; assign a new vector to the ball instead.')
+
+    def __iadd__(self, other):
+        return Vector(self.x + other.x, self.y + other.y)
+
+    def __isub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y)
+
+    def __imul__(self, scale):
+        return Vector(self.x * scale, self.y * scale)
+
+class ArrayBall(object):
+    # A thin view of one row of a BallArray.  It exposes the same attributes as a
+    # Ball so that the UI and anything else off the hot path can work with it unchanged,
+    # but the vectors it returns are read-only copies, which must be replaced rather than
+    # changed.  The table's own step never goes through them; it reads and writes whole
+    # rows of the arrays.  The radius and mass are kept here too, as plain floats, since
+    # they are read far more often than they are changed.
+
+    def __init__(self, ball_array, index, number):
+        self.ball_array = ball_array
+        self.index = index
+        self.number = number
+        self.pocketed = False
+        self._radius = float(ball_array.radius[index])
+        self._mass = float(ball_array.mass[index])
+
+    @property
+    def position(self):
+        x, y = self.ball_array.position[self.index].tolist()
+        return ArrayVector(x, y)
+
+    @position.setter
+    def position(self, value):
+        self.ball_array.position[self.index] = (value.x, value.y)
+
+    @property
+    def velocity(self):
+        x, y = self.ball_array.velocity[self.index].tolist()
+        return ArrayVector(x, y)
+
+    @velocity.setter
+    def velocity(self, value):
+        self.ball_array.velocity[self.index] = (value.x, value.y)
+
+    @property
+    def radius(self):
+        return self._radius
+
+    @radius.setter
+    def radius(self, value):
+        self._radius = float(value)
+        self.ball_array.radius[self.index] = value
+
+    @property
+    def mass(self):
+        return self._mass
+
+    @mass.setter
+    def mass(self, value):
+        self._mass = float(value)
+        self.ball_array.mass[self.index] = value
+
+class ArrayContactFinder(SpatialGrid):
+    # The spatial grid for a table whose balls live in a BallArray.  It hashes the balls
+    # into the same cells as a SpatialGrid, but straight from the rows of the arrays, so
+    # it never goes through the balls' vectors.  The full sweep for every contact is done
+    # differently: rather than walking the cells, it tests every pair of balls at once with
+    # NumPy, which for a table's worth of balls is both simpler and faster.
+
+    def __init__(self, ball_array, cell_size=1.0):
+        super().__init__(cell_size)
+        self.ball_array = ball_array
+        self.ball_list = []
+        self.index_array = numpy.zeros(0, dtype=numpy.intp)
+        self.radius_list = []
+        self.pair_count = -1
+        self.first_array = self.second_array = None
+
+    def rebuild(self, ball_list):
+        self.clear()
+        self.ball_list = list(ball_list)
+        self.index_array = numpy.array([ball.index for ball in self.ball_list], dtype=numpy.intp)
+        self.radius_list = self.ball_array.radius.tolist()
+        if len(self.ball_list) == 0:
+            return
+        radius = self.ball_array.radius[self.index_array]
+        if radius.max() > 0.0:
+            self.cell_size = 2.0 * float(radius.max())
+        cell_array = numpy.floor(self.ball_array.position[self.index_array] / self.cell_size).astype(int)
+        for ball, (i, j) in zip(self.ball_list, cell_array.tolist()):
+            self._insert_at(ball, (i, j))
+
+    def _insert_at(self, ball, key):
+        cell = self.cell_map.get(key)
+        if cell is None:
+            cell = []
+            self.cell_map[key] = cell
+        cell.append(ball)
+        self.ball_cell_map[ball] = key
+
+    def _ball_cell_key(self, ball):
+        x, y = self.ball_array.position[ball.index].tolist()
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def insert(self, ball):
+        self._insert_at(ball, self._ball_cell_key(ball))
+
+    def update(self, ball):
+        key = self._ball_cell_key(ball)
+        if self.ball_cell_map.get(ball) != key:
+            self.remove(ball)
+            self._insert_at(ball, key)
+
+    def count_pair_tests(self):
+        count = len(self.ball_list)
+        return count * (count - 1) // 2
+
+    def find_contacts(self, epsilon=1e-7):
+        # The same test as balls_overlap, done for every pair at once.
+        count = len(self.ball_list)
+        if count < 2:
+            return []
+        if self.pair_count != count:
+            self.first_array, self.second_array = numpy.triu_indices(count, 1)
+            self.pair_count = count
+        index_array = self.index_array
+        position = self.ball_array.position[index_array]
+        radius = self.ball_array.radius[index_array]
+        first_array, second_array = self.first_array, self.second_array
+        delta = position[second_array] - position[first_array]
+        distance = radius[first_array] + radius[second_array] - epsilon
+        overlap_array = delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1] < distance * distance
+        ball_list = self.ball_list
+        return [(ball_list[i], ball_list[j]) for i, j in zip(first_array[overlap_array].tolist(), second_array[overlap_array].tolist())]
+
+    def find_contacts_with(self, ball, epsilon=1e-7):
+        position = self.ball_array.position
+        radius_list = self.radius_list
+        cell_map = self.cell_map
+        x, y = position[ball.index].tolist()
+        radius = radius_list[ball.index]
+        i, j = self.ball_cell_map[ball]
+        contact_list = []
+        for di in range(-1, 2):
+            for dj in range(-1, 2):
+                cell = cell_map.get((i + di, j + dj))
+                if cell is None:
+                    continue
+                for other_ball in cell:
+                    if other_ball is ball:
+                        continue
+                    other_x, other_y = position[other_ball.index].tolist()
+                    dx = other_x - x
+                    dy = other_y - y
+                    distance = radius + radius_list[other_ball.index] - epsilon
+                    if dx * dx + dy * dy < distance * distance:
+                        contact_list.append((ball, other_ball))
+        return contact_list
@@ -0,0 +1,131 @@
+# batch_evaluator.py
+
+import math
+import concurrent.futures
+
+from math2d_vector import Vector
+from event_simulator import EventDrivenSimulator
+from table_state import TableState
+from shot_result import ShotResult
+from shot_cache import shot_config
+
+# Each worker process builds its own table once, when it starts, and then just restores
+# a snapshot into it for every shot it evaluates; no balls or vectors are ever pickled.
+# The table is built with the same balls, given as (number, radius, mass) triples, and the
+# same contact solver, given as its class and settings, as the one we were handed.
+_worker_pool_table = None
+_worker_state = None
+
+def _initialize_worker(table_class, table_args, friction, max_advance_distance, ball_layout, solver_settings, state_data):
+    global _worker_pool_table, _worker_state
+    pool_table = table_class(*table_args)
+    pool_table.friction = friction
+    pool_table.max_advance_distance = max_advance_distance
+    if tuple((ball.number, ball.radius, ball.mass) for ball in pool_table.state_ball_list) != ball_layout:
+        pool_table.clear_balls()
+        for number, radius, mass in ball_layout:
+            pool_table.add_ball(number, Vector(0.0, 0.0), mass=mass, radius=radius)
+    if solver_settings is not None:
+        solver_class, solver_args = solver_settings
+        pool_table.contact_solver = solver_class(pool_table, *solver_args)
+    _worker_pool_table = pool_table
+    _worker_state = TableState.from_bytes(state_data)
+
+def _evaluate_shot_chunk(shot_chunk, state_data, max_time, use_event_simulator):
+    pool_table = _worker_pool_table
+    state = _worker_state if state_data is None else TableState.from_bytes(state_data)
+    simulator = EventDrivenSimulator(pool_table) if use_event_simulator else None
+    result_list = []
+    for angle, speed in shot_chunk:
+        pool_table.restore_state(state)
+        result = pool_table.simulate_shot(Vector(radius=speed, angle=angle), max_time=max_time, simulator=simulator)
+        result_list.append(((angle, speed), result))
+    return result_list
+
+class BatchShotEvaluator(object):
+    # Evaluates many candidate (angle, speed) cue shots for one table layout across a pool
+    # of worker processes.  The table is snapshotted once when the evaluator is created,
+    # and shots are sent out in chunks so that the pickling cost is amortized.  Use it as a
+    # context manager to keep the same worker processes around for several batches.  If a
+    # shot cache is given, shots found in it are never sent out at all.
+
+    def __init__(self, pool_table, max_workers=None, chunk_size=32, max_time=60.0, use_event_simulator=False, shot_cache=None):
+        self.table_class = type(pool_table)
+        self.table_args = (pool_table.pocket_radius, pool_table.ball_radius, pool_table.cue_ball_mass, pool_table.other_ball_mass)
+        self.friction = pool_table.friction
+        self.max_advance_distance = pool_table.max_advance_distance
+        self.ball_layout = tuple((ball.number, ball.radius, ball.mass) for ball in pool_table.state_ball_list)
+        self.solver_settings = None
+        contact_solver = pool_table.contact_solver
+        if contact_solver is not None:
+            solver_args = (contact_solver.velocity_iterations, contact_solver.position_iterations, contact_solver.restitution, contact_solver.correction, contact_solver.slop)
+            self.solver_settings = (type(contact_solver), solver_args)
+        self.state_data = pool_table.save_state().to_bytes()
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_time = max_time
+        self.use_event_simulator = use_event_simulator
+        self.shot_cache = shot_cache
+        # The shared config covers the table and its balls, its contact solver and the simulator.
+        simulator = EventDrivenSimulator(pool_table) if use_event_simulator else None
+        self.shot_config = ('batch',) + shot_config(pool_table, simulator, {'max_time': max_time})
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = self._create_executor()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown()
+        self.executor = None
+
+    def _create_executor(self):
+        initargs = (self.table_class, self.table_args, self.friction, self.max_advance_distance, self.ball_layout, self.solver_settings, self.state_data)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, initializer=_initialize_worker, initargs=initargs)
+
+    def evaluate(self, shot_list, state=None):
+        # Yields (shot, result) pairs in whatever order they complete, where each shot is
+        # an (angle, speed) pair and each result is a ShotResult.  Shots are taken from the
+        # snapshot made when the evaluator was created, unless another TableState is given.
+        state_data = None if state is None else state.to_bytes()
+        shot_list = list(shot_list)
+        key_map = {}
+        if self.shot_cache is not None:
+            key_state = state if state is not None else TableState.from_bytes(self.state_data)
+            remaining_list = []
+            for shot in shot_list:
+                velocity = Vector(radius=shot[1], angle=shot[0])
+                key = self.shot_cache.make_key(key_state, velocity.x, velocity.y, self.shot_config)
+                result = self.shot_cache.get(key, ShotResult.from_data)
+                if result is not None:
+                    yield shot, result
+                else:
+                    key_map[shot] = key
+                    remaining_list.append(shot)
+            shot_list = remaining_list
+        if len(shot_list) == 0:
+            return
+        executor = self.executor
+        if executor is None:
+            executor = self._create_executor()
+        try:
+            future_list = []
+            for i in range(0, len(shot_list), self.chunk_size):
+                shot_chunk = shot_list[i:i + self.chunk_size]
+                future_list.append(executor.submit(_evaluate_shot_chunk, shot_chunk, state_data, self.max_time, self.use_event_simulator))
+            for future in concurrent.futures.as_completed(future_list):
+                for shot, result in future.result():
+                    if self.shot_cache is not None:
+                        self.shot_cache.put(key_map[shot], result.to_data())
+                    yield shot, result
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(cancel_futures=True)
+
+    def evaluate_grid(self, angle_count, speed_list):
+        shot_list = []
+        for i in range(angle_count):
+            angle = 2.0 * math.pi * (float(i) / float(angle_count))
+            for speed in speed_list:
+                shot_list.append((angle, speed))
+        return self.evaluate(shot_list)
\ No newline at end of file
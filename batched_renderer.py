@@ -0,0 +1,166 @@
+# batched_renderer.py
+
+import math
+import numpy
+
+from OpenGL.GL import *
+from pool_table_renderer import PoolTableRenderer
+from texture_manager import get_texture_manager
+from table_state import TableState
+
+class BatchedPoolTableRenderer(PoolTableRenderer):
+    # Draws a whole table in a handful of GL calls.  All of the ball sprites are packed
+    # into a single texture atlas, so every ball is drawn with one glDrawArrays from a
+    # vertex array that is filled in with NumPy each frame, and the cushions and pockets,
+    # which never move, are uploaded once into a vertex buffer.  The ball positions are
+    # read by saving the table into a snapshot we keep, which the table fills in without
+    # allocating, and viewing its data as a NumPy array with a row per ball.  A ball with
+    # no sprite in the atlas is drawn as an outline, as the old renderer does.  If the
+    # atlas can't be made, we fall back to drawing the table the old way.
+
+    POCKET_SIDES = 24
+
+    # The corners of a ball's quad, in units of its radius.
+    CORNER_ARRAY = numpy.array([[-1.0, -1.0], [1.0, -1.0], [1.0, 1.0], [-1.0, 1.0]], dtype=numpy.float32)
+
+    def __init__(self):
+        super().__init__()
+        self.texture_manager = get_texture_manager()
+        self.ball_vertex_array = numpy.zeros((0, 4, 2), dtype=numpy.float32)
+        self.ball_texcoord_array = numpy.zeros((0, 4, 2), dtype=numpy.float32)
+        self.ball_state = None
+        self.ball_state_array = None
+        self.ball_number_array = None
+        self.ball_radius_array = None
+        self.outline_ball_list = []
+        self.static_buffer = None
+        self.static_segment_list = None
+        self.cushion_vertex_count = 0
+        self.pocket_vertex_count = 0
+
+    def load_textures(self, number_list=range(0, 16)):
+        # The atlas comes from the shared texture manager, which loads it in the background;
+        # until it's ready we draw the balls as outlines.
+        self.texture_manager.start_loading()
+
+    def release_textures(self):
+        # The atlas texture is shared, so it is left to the texture manager.
+        if self.static_buffer is not None:
+            try:
+                glDeleteBuffers(1, [self.static_buffer])
+            except Exception as ex:
+                error = str(ex)
+            self.static_buffer = None
+            self.static_segment_list = None
+        super().release_textures()
+
+    def _update_static_buffer(self, pool_table):
+        # The table geometry only changes when it is recalculated, which replaces the
+        # segment list, so that's what we check to know when to upload it again.
+        if self.static_buffer is not None and self.static_segment_list is pool_table.segment_list:
+            return
+
+        vertex_list = []
+        for segment in pool_table.segment_list:
+            vertex_list.append((segment.point_a.x, segment.point_a.y))
+            vertex_list.append((segment.point_b.x, segment.point_b.y))
+        self.cushion_vertex_count = len(vertex_list)
+
+        sides = self.POCKET_SIDES
+        for pocket in pool_table.pocket_list:
+            for i in range(sides):
+                for j in (i, i + 1):
+                    angle = 2.0 * math.pi * (float(j) / float(sides))
+                    vertex_list.append((pocket.center.x + pocket.radius * math.cos(angle), pocket.center.y + pocket.radius * math.sin(angle)))
+        self.pocket_vertex_count = len(vertex_list) - self.cushion_vertex_count
+
+        vertex_array = numpy.array(vertex_list, dtype=numpy.float32)
+        if self.static_buffer is None:
+            self.static_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.static_buffer)
+        glBufferData(GL_ARRAY_BUFFER, vertex_array.nbytes, vertex_array, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.static_segment_list = pool_table.segment_list
+
+    def _update_ball_arrays(self, pool_table, texcoord_array):
+        if self.ball_state is None or self.ball_state.number_list != pool_table.state_number_list:
+            self.ball_state = TableState(pool_table.state_number_list)
+            self.ball_state_array = numpy.frombuffer(self.ball_state.data, dtype=numpy.float64)[1:].reshape((-1, TableState.BALL_STRIDE))
+            self.ball_number_array = numpy.array(self.ball_state.number_list, dtype=numpy.intp)
+            self.ball_radius_array = numpy.array([ball.radius for ball in pool_table.state_ball_list], dtype=numpy.float32)
+        pool_table.save_state(self.ball_state)
+        state_array = self.ball_state_array
+
+        # Pocketed balls aren't drawn, and neither are balls with no sprite in the atlas,
+        # which get an outline instead.
+        visible_array = state_array[:, 4] == 0.0
+        has_sprite_array = self.ball_number_array < texcoord_array.shape[0]
+        self.outline_ball_list = []
+        if not numpy.all(has_sprite_array):
+            for i in numpy.flatnonzero(visible_array & ~has_sprite_array):
+                self.outline_ball_list.append(pool_table.state_ball_list[i])
+            visible_array &= has_sprite_array
+
+        count = int(numpy.count_nonzero(visible_array))
+        if self.ball_vertex_array.shape[0] != count:
+            self.ball_vertex_array = numpy.zeros((count, 4, 2), dtype=numpy.float32)
+            self.ball_texcoord_array = numpy.zeros((count, 4, 2), dtype=numpy.float32)
+        if count == 0:
+            return
+
+        position_array = state_array[visible_array, 0:2].astype(numpy.float32)
+        radius_array = self.ball_radius_array[visible_array]
+        number_array = self.ball_number_array[visible_array]
+
+        numpy.multiply(self.CORNER_ARRAY[numpy.newaxis, :, :], radius_array[:, numpy.newaxis, numpy.newaxis], out=self.ball_vertex_array)
+        self.ball_vertex_array += position_array[:, numpy.newaxis, :]
+        numpy.take(texcoord_array, number_array, axis=0, out=self.ball_texcoord_array)
+
+    def draw(self, pool_table):
+        texture_manager = self.texture_manager
+        if texture_manager.has_failed():
+            if len(self.texture_map) == 0:
+                super().load_textures()
+            super().draw(pool_table)
+            return
+
+        texture = texture_manager.atlas_texture()
+        self._update_static_buffer(pool_table)
+        if texture is not None:
+            self._update_ball_arrays(pool_table, texture_manager.texcoord_array())
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        try:
+            # Draw the bumpers and then the pockets, both out of the static buffer.
+            glBindBuffer(GL_ARRAY_BUFFER, self.static_buffer)
+            glVertexPointer(2, GL_FLOAT, 0, None)
+            glColor3f(1.0, 1.0, 1.0)
+            glDrawArrays(GL_LINES, 0, self.cushion_vertex_count)
+            glColor3f(0.5, 0.5, 0.5)
+            glDrawArrays(GL_LINES, self.cushion_vertex_count, self.pocket_vertex_count)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+            # Draw all of the balls at once.
+            count = self.ball_vertex_array.shape[0]
+            if texture is None:
+                glColor3f(1.0, 1.0, 1.0)
+                for ball in pool_table.ball_list:
+                    self.draw_ball(ball, wire_frame=True)
+            elif count > 0:
+                glColor3f(1.0, 1.0, 1.0)
+                glEnable(GL_TEXTURE_2D)
+                glBindTexture(GL_TEXTURE_2D, texture)
+                glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+                try:
+                    glVertexPointer(2, GL_FLOAT, 0, self.ball_vertex_array)
+                    glTexCoordPointer(2, GL_FLOAT, 0, self.ball_texcoord_array)
+                    glDrawArrays(GL_QUADS, 0, 4 * count)
+                finally:
+                    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+                    glDisable(GL_TEXTURE_2D)
+            if texture is not None and len(self.outline_ball_list) > 0:
+                glColor3f(1.0, 1.0, 1.0)
+                for ball in self.outline_ball_list:
+                    self.draw_ball(ball, wire_frame=True)
+        finally:
+            glDisableClientState(GL_VERTEX_ARRAY)
@@ -0,0 +1,259 @@
+# benchmark.py
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+from math2d_vector import Vector
+from pool_table import PoolTable
+from array_pool_table import ArrayPoolTable
+from event_simulator import EventDrivenSimulator
+from contact_solver import ContactSolver
+
+# Canonical scenarios for judging changes to the simulation.  Each one sets up a table from
+# a fixed seed and then runs it a frame at a time, just as the game does, until every ball
+# has settled or the scenario's time runs out.  We report how many substeps were taken and
+# how fast, how many collisions were resolved, the wall time it took, and the peak memory
+# allocated along the way (in a separate run, since tracing allocations is slow.)  Results
+# can be saved as a baseline and later runs checked against it.
+#
+#   python benchmark.py --save-baseline baseline.json
+#   python benchmark.py --baseline baseline.json
+
+FRAME_TIME = 1.0 / 60.0
+POCKET_RADIUS = 1.0 / 9.0
+
+TABLE_CLASS_MAP = {
+    'list': PoolTable,
+    'array': ArrayPoolTable
+}
+
+SIMULATOR_CLASS_MAP = {
+    'fixed': None,
+    'event': EventDrivenSimulator
+}
+
+def _setup_break(pool_table, rng):
+    pool_table.reset_balls()
+    pool_table.find_cue_ball().velocity = Vector(-10.0, rng.uniform(-0.1, 0.1))
+
+def _setup_cushion_roll(pool_table, rng):
+    # A slow ball rolling along the bottom cushion into a few balls resting against it.
+    # Each hit presses the balls into the cushion and the cushion pushes them back, which
+    # is the case that can give us a long run of repeated bumper hits.
+    pool_table.clear_balls()
+    radius = pool_table.ball_radius
+    pool_table.add_ball(0, Vector(-1.6, -1.0 + radius + 2e-3), Vector(1.0, -0.02))
+    for number in range(1, 4):
+        pool_table.add_ball(number, Vector(-1.2 + (number - 1) * 2.02 * radius, -1.0 + radius + 5e-4))
+
+def _setup_dense_cluster(pool_table, rng):
+    # Fifteen balls packed together in the middle of the table, all nudged a little, and
+    # the cue ball driven into them.
+    pool_table.clear_balls()
+    spacing = 2.0 * pool_table.ball_radius * 1.001
+    number = 1
+    for row in range(3):
+        for column in range(5):
+            x = (column - 2.0 + 0.5 * (row % 2)) * spacing
+            y = (row - 1.0) * spacing * 0.8660254
+            velocity = Vector(rng.uniform(-0.2, 0.2), rng.uniform(-0.2, 0.2))
+            pool_table.add_ball(number, Vector(x, y), velocity)
+            number += 1
+    pool_table.add_ball(0, Vector(1.5, 0.02), Vector(-6.0, 0.0))
+
+def _setup_hundred_balls(pool_table, rng):
+    # A custom table with a hundred balls set out on a jittered grid, every one of them
+    # moving in some random direction.
+    pool_table.clear_balls()
+    for number in range(100):
+        x = -1.8 + 0.36 * (number % 10) + rng.uniform(-0.05, 0.05)
+        y = -0.85 + 0.18 * (number // 10) + rng.uniform(-0.02, 0.02)
+        speed = rng.uniform(0.0, 3.0)
+        velocity = Vector(rng.uniform(-1.0, 1.0), rng.uniform(-1.0, 1.0))
+        velocity.Normalize()
+        pool_table.add_ball(number, Vector(x, y), velocity * speed)
+
+# Each scenario is a name, a setup function and the most time it may simulate.
+SCENARIO_LIST = [
+    ('break', _setup_break, 60.0),
+    ('cushion_roll', _setup_cushion_roll, 30.0),
+    ('dense_cluster', _setup_dense_cluster, 60.0),
+    ('hundred_balls', _setup_hundred_balls, 60.0)
+]
+
+class _Tally(object):
+    def __init__(self):
+        self.substep_count = 0
+        self.ball_hit_count = 0
+        self.bumper_hit_count = 0
+        self.pocket_count = 0
+
+    def event_callback(self, event, intensity, ball=None, other_ball=None):
+        if event == 'ball_hit_ball':
+            self.ball_hit_count += 1
+        elif event == 'ball_hit_bumper':
+            self.bumper_hit_count += 1
+        elif event == 'ball_in_pocket':
+            self.pocket_count += 1
+
+def _run_once(setup, max_time, table_class, simulator_class, seed, contact_solver=False):
+    rng = random.Random(seed)
+    pool_table = table_class(POCKET_RADIUS, rng=rng)
+    setup(pool_table, rng)
+    if contact_solver:
+        pool_table.contact_solver = ContactSolver(pool_table)
+    tally = _Tally()
+
+    simulator = None
+    if simulator_class is not None:
+        simulator = simulator_class(pool_table)
+    else:
+        # Count the substeps by wrapping them.
+        advance_balls = pool_table._advance_balls
+        def counting_advance_balls(delta_time, event_callback=None):
+            tally.substep_count += 1
+            advance_balls(delta_time, event_callback)
+        pool_table._advance_balls = counting_advance_balls
+
+    simulated_time = 0.0
+    start_time = time.perf_counter()
+    while simulated_time < max_time and not pool_table.is_settled():
+        if simulator is not None:
+            simulator.advance(FRAME_TIME, tally.event_callback)
+            if isinstance(simulator, EventDrivenSimulator):
+                # The event count starts over with every call to advance.
+                tally.substep_count += simulator.event_count
+        else:
+            pool_table.advance_simulation(FRAME_TIME, tally.event_callback)
+        simulated_time += FRAME_TIME
+    wall_time = time.perf_counter() - start_time
+
+    return wall_time, simulated_time, tally
+
+def run_scenario(name, table_name='list', simulator_name='fixed', seed=0, repeat=3, trace_memory=True, contact_solver=False):
+    for scenario_name, setup, max_time in SCENARIO_LIST:
+        if scenario_name == name:
+            break
+    else:
+        raise ValueError('No scenario named %s.' % name)
+    table_class = TABLE_CLASS_MAP[table_name]
+    simulator_class = SIMULATOR_CLASS_MAP[simulator_name]
+
+    # The simulation is deterministic, so every run does the same work; keep the fastest.
+    best_wall_time = None
+    for i in range(repeat):
+        wall_time, simulated_time, tally = _run_once(setup, max_time, table_class, simulator_class, seed, contact_solver)
+        if best_wall_time is None or wall_time < best_wall_time:
+            best_wall_time = wall_time
+
+    peak_kib = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _run_once(setup, max_time, table_class, simulator_class, seed, contact_solver)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_kib = peak / 1024.0
+
+    return {
+        'wall_time': best_wall_time,
+        'simulated_time': simulated_time,
+        'settled': simulated_time < max_time,
+        'substep_count': tally.substep_count,
+        'substeps_per_second': tally.substep_count / best_wall_time if best_wall_time > 0.0 else 0.0,
+        'ball_hit_count': tally.ball_hit_count,
+        'bumper_hit_count': tally.bumper_hit_count,
+        'pocket_count': tally.pocket_count,
+        'peak_kib': peak_kib
+    }
+
+def run_benchmark(name_list=None, table_name='list', simulator_name='fixed', seed=0, repeat=3, trace_memory=True, contact_solver=False):
+    result_map = {}
+    for name, setup, max_time in SCENARIO_LIST:
+        if name_list is None or name in name_list:
+            result_map[name] = run_scenario(name, table_name, simulator_name, seed, repeat, trace_memory, contact_solver)
+    return {
+        'config': {
+            'table': table_name,
+            'simulator': simulator_name,
+            'contact_solver': contact_solver,
+            'seed': seed,
+            'frame_time': FRAME_TIME,
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'scenarios': result_map
+    }
+
+def compare_to_baseline(report, baseline, tolerance=0.2):
+    # Returns a list of (scenario, message, is_regression) findings.  Being slower than the
+    # baseline by more than the tolerance is a regression.  Different counts mean that the
+    # simulation now behaves differently, which is worth knowing but may well be intended.
+    finding_list = []
+    baseline_config = baseline.get('config', {})
+    for key in ('table', 'simulator', 'contact_solver'):
+        if baseline_config.get(key, False) != report['config'][key]:
+            finding_list.append(('*', 'baseline was made with a different %s' % key.replace('_', ' '), False))
+    for name, result in report['scenarios'].items():
+        baseline_result = baseline.get('scenarios', {}).get(name)
+        if baseline_result is None:
+            finding_list.append((name, 'not in baseline', False))
+            continue
+        ratio = result['wall_time'] / baseline_result['wall_time'] if baseline_result['wall_time'] > 0.0 else 1.0
+        if ratio > 1.0 + tolerance:
+            finding_list.append((name, 'wall time %.3fs is %.0f%% slower than baseline %.3fs' % (result['wall_time'], (ratio - 1.0) * 100.0, baseline_result['wall_time']), True))
+        elif ratio < 1.0 - tolerance:
+            finding_list.append((name, 'wall time %.3fs is %.0f%% faster than baseline %.3fs' % (result['wall_time'], (1.0 - ratio) * 100.0, baseline_result['wall_time']), False))
+        for key in ('substep_count', 'ball_hit_count', 'bumper_hit_count', 'pocket_count', 'settled'):
+            if result[key] != baseline_result.get(key):
+                finding_list.append((name, '%s changed from %s to %s' % (key, baseline_result.get(key), result[key]), False))
+    return finding_list
+
+def _print_report(report):
+    print('%-14s %10s %10s %9s %12s %9s %9s %7s %10s' % ('scenario', 'wall (s)', 'sim (s)', 'substeps', 'substeps/s', 'ball hits', 'bumpers', 'pocket', 'peak (KiB)'))
+    for name, result in report['scenarios'].items():
+        peak_text = '-' if result['peak_kib'] is None else '%.1f' % result['peak_kib']
+        print('%-14s %10.4f %10.2f %9d %12.0f %9d %9d %7d %10s' % (name, result['wall_time'], result['simulated_time'], result['substep_count'],
+            result['substeps_per_second'], result['ball_hit_count'], result['bumper_hit_count'], result['pocket_count'], peak_text))
+
+def main(argument_list=None):
+    parser = argparse.ArgumentParser(description='Run the canonical physics scenarios.')
+    parser.add_argument('--scenario', action='append', choices=[name for name, setup, max_time in SCENARIO_LIST], help='run only this scenario (may be repeated)')
+    parser.add_argument('--table', choices=sorted(TABLE_CLASS_MAP), default='list')
+    parser.add_argument('--simulator', choices=sorted(SIMULATOR_CLASS_MAP), default='fixed')
+    parser.add_argument('--contact-solver', action='store_true', help='resolve collisions with the bounded contact solver')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the allocation tracing run')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the results to this file')
+    parser.add_argument('--baseline', metavar='PATH', help='compare the results with this file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fraction slower than the baseline that counts as a regression')
+    arguments = parser.parse_args(argument_list)
+
+    report = run_benchmark(arguments.scenario, arguments.table, arguments.simulator, arguments.seed, arguments.repeat, not arguments.no_memory, arguments.contact_solver)
+    _print_report(report)
+
+    if arguments.save_baseline is not None:
+        with open(arguments.save_baseline, 'w') as handle:
+            json.dump(report, handle, indent=4, sort_keys=True)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, 'r') as handle:
+            baseline = json.load(handle)
+        regression_count = 0
+        for name, message, is_regression in compare_to_baseline(report, baseline, arguments.tolerance):
+            print('%s %s: %s' % ('REGRESSION' if is_regression else 'note', name, message))
+            if is_regression:
+                regression_count += 1
+        if regression_count > 0:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,9 @@
 
 import time
 import math
-import functools
+import threading
 
 from PyQt5 import QtGui, QtCore, QtWidgets, QtOpenGL
-from PyQt5 import QtMultimedia
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
@@ -13,7 +12,16 @@ from math2d_aa_rect import AxisAlignedRectangle
 from math2d_text import TextRenderer
 from math2d_vector import Vector
 from pool_table import PoolTable
+from batched_renderer import BatchedPoolTableRenderer
 from cue_stick import CueStick
+from trajectory_recorder import TrajectoryRecorder, TrajectoryReader
+from physics_thread import PhysicsThread
+from contact_solver import ContactSolver
+from profiler import SimulationProfiler
+from frame_scheduler import FrameScheduler
+from aim_preview import AimPreviewWorker
+from sound_player import SoundPlayer
+from shot_planner import ShotPlanner
 
 class Canvas(QtOpenGL.QGLWidget):
     MODE_PLACE_CUE_BALL = 1
@@ -24,14 +32,34 @@ class Canvas(QtOpenGL.QGLWidget):
         gl_format.setAlpha(True)
         gl_format.setDepth(False)
         gl_format.setDoubleBuffer(True)
+        gl_format.setSwapInterval(1)
 
         super().__init__(gl_format, parent)
         
+        # The simulation runs on its own thread at a fixed rate; all we do here is handle
+        # input, play sounds and draw, once per screen refresh, from a separate display
+        # table that is posed between the last two states the physics thread published.
         self.pool_table = None
+        self.physics = None
+        self.display_table = None
+        self.display_state = None
+        self.pool_table_renderer = None
+        self.aim_preview = None
+        self.aim_preview_worker = None
+        self.shot_planner = None
+        self.planner_thread = None
+        self.planned_shot = None
         
+        refresh_rate = 60.0
+        screen = QtWidgets.QApplication.primaryScreen()
+        if screen is not None and screen.refreshRate() > 0.0:
+            refresh_rate = screen.refreshRate()
+        # We only animate while something is happening; see wake.
         self.animation_timer = QtCore.QTimer()
-        self.animation_timer.start(1)
+        self.animation_timer.setTimerType(QtCore.Qt.PreciseTimer)
         self.animation_timer.timeout.connect(self.animation_step)
+        self.frame_scheduler = FrameScheduler(self.animation_timer, int(1000.0 / refresh_rate))
+        self.frame_scheduler.wake()
         
         self.last_render_time = time.time()
         self.last_animation_time = time.time()
@@ -43,13 +71,19 @@ class Canvas(QtOpenGL.QGLWidget):
         
         self.mode = self.MODE_PLACE_CUE_BALL
         
-        try:
-            self.ball_hit_ball_sound = QtMultimedia.QSound('Sounds/ball_hit_ball.wav')
-            self.ball_hit_bumper_sound = QtMultimedia.QSound('Sounds/ball_hit_bumper.wav')
-            self.ball_in_pocket_sound = QtMultimedia.QSound('Sounds/ball_in_pocket.wav')
-        except Exception as ex:
-            error = str(ex)
-            error = None
+        self.undo_list = []
+        self.max_undo_count = 32
+        
+        self.recording_path = 'recording.trj'
+        self.recorder = None
+        self.recording_time = 0.0
+        self.replay_reader = None
+        self.replay_time = 0.0
+        self.replay_frame = 0
+        
+        self.profiler = None
+        
+        self.sound_player = SoundPlayer()
     
     def initializeGL(self):
         glClearColor(0.0, 0.4, 0.0, 0.0)
@@ -58,6 +92,25 @@ class Canvas(QtOpenGL.QGLWidget):
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
         self.pool_table = PoolTable(1.0 / 9.0)
+        self.pool_table.contact_solver = ContactSolver(self.pool_table)
+        self.display_table = PoolTable(1.0 / 9.0)
+        self.display_state = self.display_table.save_state()
+        self.physics = PhysicsThread(self.pool_table)
+        self.physics.start()
+        
+        # Aim previews are simulated on a table of their own, set up just like the real one.
+        preview_table = PoolTable(1.0 / 9.0)
+        preview_table.contact_solver = ContactSolver(preview_table)
+        self.aim_preview_worker = AimPreviewWorker(preview_table)
+        self.aim_preview_worker.start()
+        
+        # Shot hints are planned on a thread of their own too, on yet another table.
+        planner_table = PoolTable(1.0 / 9.0)
+        planner_table.contact_solver = ContactSolver(planner_table)
+        self.shot_planner = ShotPlanner(planner_table)
+        
+        self.pool_table_renderer = BatchedPoolTableRenderer()
+        self.pool_table_renderer.load_textures()
         
     def resizeGL(self, width, height):
         glViewport(0, 0, width, height)
@@ -78,7 +131,13 @@ class Canvas(QtOpenGL.QGLWidget):
         viewport_rect.max_point.x = float(viewport[2])
         viewport_rect.max_point.y = float(viewport[3])
         
-        proj_rect = self.pool_table.border_rect.Copy()
+        settled = False
+        if self.replay_reader is None:
+            snapshot = self.physics.interpolate(self.display_state)
+            self.display_table.restore_state(self.display_state)
+            settled = snapshot.settled
+        
+        proj_rect = self.display_table.border_rect.Copy()
         proj_rect.ExpandToMatchAspectRatioOf(viewport_rect)
         proj_rect.Scale(1.1)
         
@@ -89,15 +148,17 @@ class Canvas(QtOpenGL.QGLWidget):
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
         
-        self.pool_table.draw()
+        self.pool_table_renderer.draw(self.display_table)
         
-        if self.pool_table.is_settled():
+        if settled:
             if self.mode == self.MODE_SHOOT_CUE_BALL:
-                cue_ball = self.pool_table.find_cue_ball()
+                cue_ball = self.display_table.find_cue_ball()
                 if cue_ball is not None:
+                    if self.aim_preview is not None:
+                        self.cue_stick.draw_preview(self.aim_preview, cue_ball.radius)
                     self.cue_stick.draw(cue_ball)
             elif self.mode == self.MODE_PLACE_CUE_BALL:
-                cue_ball = self.pool_table.find_cue_ball()
+                cue_ball = self.display_table.find_cue_ball()
                 if cue_ball is not None:
                     glColor3f(1.0, 1.0, 1.0)
                     Vector(0.2, 0.0).Render(cue_ball.position, arrow_head_length=0.05)
@@ -112,55 +173,225 @@ class Canvas(QtOpenGL.QGLWidget):
         rect.max_point.y = rect.min_point.y + (rect.max_point.y - rect.min_point.y) * 0.05
         self.text_renderer.render_text(self.fps_text, rect)
         
+        if self.profiler is not None:
+            line_height = (proj_rect.max_point.y - proj_rect.min_point.y) * 0.03
+            for i, line in enumerate(self.profiler.format_lines()):
+                rect = proj_rect.Copy()
+                rect.max_point.y = proj_rect.max_point.y - float(i) * line_height
+                rect.min_point.y = rect.max_point.y - line_height
+                self.text_renderer.render_text(line, rect)
+        
         glFlush()
     
-    def _pool_table_event_callback(self, event_map, event, intensity):
-        event_map[event] = intensity
-    
     def animation_step(self):
         
         current_animation_time = time.time()
         elapsed_time = current_animation_time - self.last_animation_time
         self.last_animation_time = current_animation_time
+        
+        if self.replay_reader is not None:
+            self._replay_step(elapsed_time)
+            self.frame_scheduler.update(True, elapsed_time)
+            self.update()
+            return
 
         self._handle_key_presses(elapsed_time)
         
-        event_map = {}
-        self.pool_table.advance_simulation(elapsed_time, event_callback=functools.partial(self._pool_table_event_callback, event_map))
-
-        # I'm not sure how many channels we get, and I don't see any way to control the intensity of the sounds.
-        # We really should very the intensity based on how hard a ball hits another ball or a bumper.
-        # I've noticed that if a ball is close to the edge of the table and is moving slow, we can sometimes get too many repeated bumper plays.
-        if 'ball_hit_ball' in event_map:
-            self.ball_hit_ball_sound.play()
-        if 'ball_hit_bumper' in event_map:
-            self.ball_hit_bumper_sound.play()
-        if 'ball_in_pocket' in event_map:
-            self.ball_in_pocket_sound.play()
+        event_list = self.physics.take_events()
+        self.sound_player.play_events(event_list)
 
+        # The display table knows the cue ball is gone as soon as the physics thread does,
+        # but only the physics thread may put it back.
         if self.mode == self.MODE_SHOOT_CUE_BALL:
-            cue_ball = self.pool_table.find_cue_ball()
-            if cue_ball is None and self.pool_table.is_settled():
-                self.pool_table.replace_cue_ball()
-                self.mode = self.MODE_PLACE_CUE_BALL
+            if self.display_table.find_cue_ball() is None and self.physics.latest_snapshot().settled:
+                if self.physics.call(self._replace_pocketed_cue_ball):
+                    self.mode = self.MODE_PLACE_CUE_BALL
+        
+        # A planned shot is handed over by just pointing the cue stick at it.
+        planned_shot = self.planned_shot
+        if planned_shot is not None:
+            self.planned_shot = None
+            if self.mode == self.MODE_SHOOT_CUE_BALL:
+                self.cue_stick.angle = planned_shot.angle
+                self.cue_stick.speed = planned_shot.speed
         
+        # Ask for the preview of the current aim; the worker cancels whatever it was doing
+        # if the aim has moved on, and we draw whatever it has in the meantime.
+        self.aim_preview = None
+        snapshot = self.physics.latest_snapshot()
+        if self.mode == self.MODE_SHOOT_CUE_BALL and snapshot.settled:
+            self.aim_preview = self.aim_preview_worker.request(snapshot.state, self.cue_stick.angle, self.cue_stick.speed)
+        
+        # Once the table has settled and nobody is touching anything, stop drawing; the
+        # last frame stays on the screen until the next key press wakes us up.
+        busy = not snapshot.settled or self.parent().is_any_key_down() or len(event_list) > 0 or \
+               self.pool_table_renderer.texture_manager.is_pending() or self.aim_preview_worker.is_busy() or self.planner_thread is not None
+        self.frame_scheduler.update(busy, elapsed_time)
         self.update()
     
+    def wake(self):
+        if self.frame_scheduler.wake():
+            self.last_animation_time = time.time()
+    
+    def _replace_pocketed_cue_ball(self, pool_table):
+        if pool_table.find_cue_ball() is None and pool_table.is_settled():
+            pool_table.replace_cue_ball()
+            return True
+        return False
+    
+    def _strike_cue_ball(self, pool_table, velocity):
+        pool_table.strike_cue_ball(velocity)
+    
+    def _move_cue_ball(self, pool_table, delta_x, delta_y):
+        cue_ball = pool_table.find_cue_ball()
+        if cue_ball is not None:
+            # Assign the position back rather than mutating it in place so that
+            # this also works for balls that are views into array-backed tables.
+            position = cue_ball.position
+            position.x += delta_x
+            position.y += delta_y
+            cue_ball.position = position
+    
     def key_strike(self, key):
+        if self.replay_reader is not None and key != QtCore.Qt.Key_P:
+            return
         if self.mode == self.MODE_SHOOT_CUE_BALL:
             if key == QtCore.Qt.Key_Return:
-                cue_ball = self.pool_table.find_cue_ball()
-                cue_ball.velocity += self.cue_stick.calc_velocity()
+                self._push_undo_state()
+                self.physics.submit(self._strike_cue_ball, self.cue_stick.calc_velocity())
         elif self.mode == self.MODE_PLACE_CUE_BALL:
             if key == QtCore.Qt.Key_Return:
                 self.mode = self.MODE_SHOOT_CUE_BALL
         if key == QtCore.Qt.Key_Escape:
-            self.pool_table.reset_balls()
+            self.physics.call(lambda pool_table: pool_table.reset_balls())
             self.mode = self.MODE_PLACE_CUE_BALL
+            self.undo_list = []
+        elif key == QtCore.Qt.Key_Backspace:
+            if len(self.undo_list) > 0:
+                self.mode = self.physics.call(lambda pool_table, state: pool_table.restore_state(state), self.undo_list.pop())
+        elif key == QtCore.Qt.Key_R:
+            self._toggle_recording()
+        elif key == QtCore.Qt.Key_P:
+            self._toggle_replay()
+        elif key == QtCore.Qt.Key_F3:
+            self._toggle_profiler()
+        elif key == QtCore.Qt.Key_H:
+            self._start_planning()
+    
+    def _start_planning(self):
+        snapshot = self.physics.latest_snapshot()
+        if self.mode == self.MODE_SHOOT_CUE_BALL and snapshot.settled and self.planner_thread is None:
+            self.planner_thread = threading.Thread(target=self._plan_shot, args=(snapshot.state,), daemon=True)
+            self.planner_thread.start()
+    
+    def _plan_shot(self, state):
+        try:
+            shot_list = self.shot_planner.plan(state)
+            if len(shot_list) > 0:
+                self.planned_shot = shot_list[0]
+        except Exception as ex:
+            error = str(ex)
+        finally:
+            self.planner_thread = None
+    
+    def _toggle_profiler(self):
+        # The profiler is filled in by the physics thread and only read from here.
+        profiler = SimulationProfiler() if self.profiler is None else None
+        self.physics.call(self._set_profiler, profiler)
+        self.profiler = profiler
+    
+    def _set_profiler(self, pool_table, profiler):
+        pool_table.profiler = profiler
+    
+    def _toggle_recording(self):
+        # The recorder is fed by the physics thread, one record per simulation step.
+        if self.recorder is None:
+            self._stop_replay()
+            self.recorder = self.physics.call(self._start_recording)
+        else:
+            self.physics.call(self._stop_recording, self.recorder)
+            self.recorder = None
+    
+    def _start_recording(self, pool_table):
+        recorder = TrajectoryRecorder(self.recording_path, pool_table)
+        self.recording_time = 0.0
+        self.physics.event_listener = recorder.record_event
+        self.physics.step_listener = lambda pool_table, elapsed_time: self._record_step(recorder, elapsed_time)
+        return recorder
+    
+    def _stop_recording(self, pool_table, recorder):
+        self.physics.event_listener = None
+        self.physics.step_listener = None
+        recorder.close()
+    
+    def _record_step(self, recorder, elapsed_time):
+        self.recording_time += elapsed_time
+        recorder.record_frame(self.recording_time)
+    
+    def _toggle_replay(self):
+        if self.replay_reader is None:
+            if self.recorder is not None:
+                self._toggle_recording()
+            try:
+                self.replay_reader = TrajectoryReader(self.recording_path)
+            except Exception as ex:
+                error = str(ex)
+                self.replay_reader = None
+                return
+            self._push_undo_state()
+            self.physics.set_paused(True).result()
+            self.replay_time = 0.0
+            self.replay_frame = -1
+        else:
+            self._stop_replay()
+    
+    def _stop_replay(self):
+        # Whatever frame the replay got to becomes the state of the real table.
+        if self.replay_reader is not None:
+            self.replay_reader.close()
+            self.replay_reader = None
+            self.physics.call(self._resume_from_replay, self.display_table.save_state())
+    
+    def _resume_from_replay(self, pool_table, state):
+        pool_table.restore_state(state)
+        self.physics.paused = False
+    
+    def _replay_step(self, elapsed_time):
+        # Jump straight to the recorded frame for the current replay time, playing the
+        # sounds of any frames skipped on the way there.
+        reader = self.replay_reader
+        if reader.frame_count == 0:
+            self._stop_replay()
+            return
+        self.replay_time += elapsed_time
+        frame = reader.find_frame(self.replay_time)
+        # Recordings only keep the strongest of each kind of event per frame, without
+        # positions or balls.
+        event_list = []
+        for i in range(self.replay_frame + 1, frame):
+            for event, count, intensity in reader.read_frame(i)[2]:
+                event_list.append((event, intensity, 0.0, 0.0, -1, -1))
+        if frame != self.replay_frame:
+            replay_time, frame_event_list = reader.apply_frame(frame, self.display_table)
+            for event, count, intensity in frame_event_list:
+                event_list.append((event, intensity, 0.0, 0.0, -1, -1))
+            self.replay_frame = frame
+        self.sound_player.play_events(event_list)
+        if frame == reader.frame_count - 1:
+            # Hand the table back to the player; a scratched cue ball is dealt with as usual.
+            self._stop_replay()
+            self.mode = self.MODE_SHOOT_CUE_BALL
+    
+    def _push_undo_state(self):
+        # Recycle the oldest snapshot once the undo list is full.
+        state = None
+        if len(self.undo_list) >= self.max_undo_count:
+            state = self.undo_list.pop(0)
+        self.undo_list.append(self.physics.call(lambda pool_table: pool_table.save_state(state, self.mode)))
     
     def _handle_key_presses(self, elapsed_time):
         window = self.parent()
-        if self.pool_table.is_settled():
+        if self.physics.latest_snapshot().settled:
             if self.mode == self.MODE_SHOOT_CUE_BALL:
                 angle_change_speed = math.pi / 5.0
                 if window.is_key_down(QtCore.Qt.Key_Shift):
@@ -177,15 +408,17 @@ class Canvas(QtOpenGL.QGLWidget):
                 if window.is_key_down(QtCore.Qt.Key_Down):
                     self.cue_stick.adjust_speed(-speed_delta)
             elif self.mode == self.MODE_PLACE_CUE_BALL:
-                cue_ball = self.pool_table.find_cue_ball()
                 move_ball_speed = 0.3
                 delta = move_ball_speed * elapsed_time
-                if cue_ball is not None:
-                    if window.is_key_down(QtCore.Qt.Key_Left):
-                        cue_ball.position.x -= delta
-                    if window.is_key_down(QtCore.Qt.Key_Right):
-                        cue_ball.position.x += delta
-                    if window.is_key_down(QtCore.Qt.Key_Down):
-                        cue_ball.position.y -= delta
-                    if window.is_key_down(QtCore.Qt.Key_Up):
-                        cue_ball.position.y += delta
\ No newline at end of file
+                delta_x = 0.0
+                delta_y = 0.0
+                if window.is_key_down(QtCore.Qt.Key_Left):
+                    delta_x -= delta
+                if window.is_key_down(QtCore.Qt.Key_Right):
+                    delta_x += delta
+                if window.is_key_down(QtCore.Qt.Key_Down):
+                    delta_y -= delta
+                if window.is_key_down(QtCore.Qt.Key_Up):
+                    delta_y += delta
+                if delta_x != 0.0 or delta_y != 0.0:
+                    self.physics.submit(self._move_cue_ball, delta_x, delta_y)
\ No newline at end of file
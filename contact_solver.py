@@ -0,0 +1,172 @@
+# contact_solver.py
+
+import math
+
+class ContactSolver(object):
+    # An alternative to the pool table's work queue for resolving collisions, with a hard
+    # bound on how much work one substep can take.  All of the touching pairs and cushion
+    # contacts are gathered once, up front, and then resolved in a fixed budget of sweeps.
+    # Each velocity sweep visits every contact in order and, if its two sides are still
+    # approaching, applies the impulse that bounces them apart with the given restitution.
+    # A contact that is already separating is left alone, so a chain of touching balls
+    # (like the rack on the break) passes momentum along it just as a row of separate
+    # collisions would.  Then a few position sweeps push apart whatever still overlaps.
+    # Contacts that only come about during the sweeps are picked up on the next substep.
+    # The ball state is read into flat lists once and written back once at the end.
+
+    def __init__(self, pool_table, velocity_iterations=8, position_iterations=4, restitution=1.0, correction=1.0, slop=1e-7):
+        self.pool_table = pool_table
+        self.velocity_iterations = velocity_iterations
+        self.position_iterations = position_iterations
+        self.restitution = restitution
+        self.correction = correction
+        self.slop = slop
+
+    def solve(self, ball_grid, contact_pair_list, cushion_ball_list, event_callback=None):
+        # Resolve the given overlapping pairs, and any of the given balls that are touching a
+        # cushion, and return the number of sweeps it took.  The grid is kept up to date.
+        pool_table = self.pool_table
+        ball_list = []
+        index_map = {}
+        x_list = []
+        y_list = []
+        vx_list = []
+        vy_list = []
+        inverse_mass_list = []
+        radius_list = []
+
+        def add_body(ball):
+            i = index_map.get(ball)
+            if i is None:
+                i = len(ball_list)
+                index_map[ball] = i
+                ball_list.append(ball)
+                x, y, velocity_x, velocity_y = pool_table._read_ball_state(ball)
+                x_list.append(x)
+                y_list.append(y)
+                vx_list.append(velocity_x)
+                vy_list.append(velocity_y)
+                inverse_mass_list.append(1.0 / ball.mass)
+                radius_list.append(ball.radius)
+            return i
+
+        # A contact is [a, b, nx, ny, px, py, number_a, number_b] with the normal pointing
+        # from side a to side b.  A cushion is side a, given as -1, and (px, py) is its
+        # contact point; ball pairs are ordered by number and may be listed more than once.
+        contact_list = []
+        pair_key_set = set()
+        for ball_a, ball_b in contact_pair_list:
+            if ball_a.number > ball_b.number:
+                ball_a, ball_b = ball_b, ball_a
+            key = (ball_a.number, ball_b.number)
+            if key in pair_key_set:
+                continue
+            pair_key_set.add(key)
+            contact_list.append([add_body(ball_a), add_body(ball_b), 0.0, 0.0, 0.0, 0.0, ball_a.number, ball_b.number])
+        for ball in cushion_ball_list:
+            contact_point, contact_normal = pool_table._find_bumper_contact(ball)
+            if contact_point is not None:
+                contact_list.append([-1, add_body(ball), contact_normal.x, contact_normal.y, contact_point.x, contact_point.y, -1, ball.number])
+        profiler = pool_table.profiler
+        if profiler is not None:
+            profiler.count('cushion_tests', len(cushion_ball_list))
+        if len(contact_list) == 0:
+            return 0
+
+        # Contacts are visited in order of ball number so that the result never depends on
+        # the order of the ball list.
+        contact_list.sort(key=lambda contact: (contact[6], contact[7]))
+        for contact in contact_list:
+            a, b = contact[0], contact[1]
+            if a >= 0:
+                self._update_pair_normal(contact, x_list, y_list)
+
+        restitution = self.restitution
+        impulse_count_list = [0] * len(contact_list)
+        intensity_list = [0.0] * len(contact_list)
+        sweep_count = 0
+        for iteration in range(self.velocity_iterations):
+            sweep_count += 1
+            resolved = False
+            for k in range(len(contact_list)):
+                a, b, nx, ny = contact_list[k][:4]
+                if a >= 0:
+                    relative_vx = vx_list[b] - vx_list[a]
+                    relative_vy = vy_list[b] - vy_list[a]
+                    inverse_mass = inverse_mass_list[a] + inverse_mass_list[b]
+                else:
+                    relative_vx = vx_list[b]
+                    relative_vy = vy_list[b]
+                    inverse_mass = inverse_mass_list[b]
+                normal_speed = relative_vx * nx + relative_vy * ny
+                if normal_speed >= 0.0:
+                    continue
+                if impulse_count_list[k] == 0:
+                    intensity_list[k] = math.sqrt(relative_vx * relative_vx + relative_vy * relative_vy)
+                impulse_count_list[k] += 1
+                impulse = -(1.0 + restitution) * normal_speed / inverse_mass
+                if a >= 0:
+                    vx_list[a] -= impulse * inverse_mass_list[a] * nx
+                    vy_list[a] -= impulse * inverse_mass_list[a] * ny
+                vx_list[b] += impulse * inverse_mass_list[b] * nx
+                vy_list[b] += impulse * inverse_mass_list[b] * ny
+                resolved = True
+            if not resolved:
+                break
+
+        for iteration in range(self.position_iterations):
+            sweep_count += 1
+            resolved = False
+            for contact in contact_list:
+                a, b = contact[0], contact[1]
+                if a >= 0:
+                    self._update_pair_normal(contact, x_list, y_list)
+                    nx, ny = contact[2], contact[3]
+                    depth = radius_list[a] + radius_list[b] - ((x_list[b] - x_list[a]) * nx + (y_list[b] - y_list[a]) * ny)
+                    inverse_mass = inverse_mass_list[a] + inverse_mass_list[b]
+                else:
+                    nx, ny = contact[2], contact[3]
+                    depth = radius_list[b] - ((x_list[b] - contact[4]) * nx + (y_list[b] - contact[5]) * ny)
+                    inverse_mass = inverse_mass_list[b]
+                if depth <= self.slop:
+                    continue
+                push = self.correction * depth / inverse_mass
+                if a >= 0:
+                    x_list[a] -= push * inverse_mass_list[a] * nx
+                    y_list[a] -= push * inverse_mass_list[a] * ny
+                x_list[b] += push * inverse_mass_list[b] * nx
+                y_list[b] += push * inverse_mass_list[b] * ny
+                resolved = True
+            if not resolved:
+                break
+
+        for i in range(len(ball_list)):
+            ball = ball_list[i]
+            pool_table._write_ball_state(ball, x_list[i], y_list[i], vx_list[i], vy_list[i])
+            ball_grid.update(ball)
+
+        if event_callback is not None:
+            for k in range(len(contact_list)):
+                if impulse_count_list[k] == 0:
+                    continue
+                a, b = contact_list[k][0], contact_list[k][1]
+                if a >= 0:
+                    event_callback('ball_hit_ball', intensity_list[k], ball_list[a], ball_list[b])
+                else:
+                    event_callback('ball_hit_bumper', intensity_list[k], ball_list[b], None)
+
+        if profiler is not None:
+            profiler.count('resolve_iterations', sweep_count)
+        return sweep_count
+
+    def _update_pair_normal(self, contact, x_list, y_list):
+        a, b = contact[0], contact[1]
+        dx = x_list[b] - x_list[a]
+        dy = y_list[b] - y_list[a]
+        length = math.sqrt(dx * dx + dy * dy)
+        if length > 0.0:
+            contact[2] = dx / length
+            contact[3] = dy / length
+        else:
+            contact[2] = 1.0
+            contact[3] = 0.0
@@ -29,4 +29,31 @@ class CueStick(object):
         glColor3f(1.0, 1.0, 1.0)
         velocity = self.calc_velocity()
         velocity *= 0.1
-        velocity.Render(cue_ball.position, arrow_head_length=0.05)
\ No newline at end of file
+        velocity.Render(cue_ball.position, arrow_head_length=0.05)
+    
+    def draw_preview(self, preview, radius):
+        # Draw the cue ball's predicted path, a ghost ball where it first hits another ball,
+        # the direction that ball goes off in, and a mark where the cue ball first hits a cushion.
+        glColor4f(1.0, 1.0, 1.0, 0.5)
+        glBegin(GL_LINE_STRIP)
+        try:
+            for x, y in list(preview.cue_path):
+                glVertex2f(x, y)
+        finally:
+            glEnd()
+        if preview.contact_point is not None:
+            self._draw_circle(preview.contact_point, radius)
+        if preview.object_ball_position is not None and preview.object_ball_direction is not None:
+            direction = Vector(preview.object_ball_direction[0], preview.object_ball_direction[1]) * 0.3
+            direction.Render(Vector(preview.object_ball_position[0], preview.object_ball_position[1]), arrow_head_length=0.05)
+        if preview.cushion_point is not None:
+            self._draw_circle(preview.cushion_point, radius * 0.25)
+    
+    def _draw_circle(self, center, radius, sides=16):
+        glBegin(GL_LINE_LOOP)
+        try:
+            for i in range(sides):
+                angle = 2.0 * math.pi * (float(i) / float(sides))
+                glVertex2f(center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle))
+        finally:
+            glEnd()
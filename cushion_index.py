@@ -0,0 +1,72 @@
+# cushion_index.py
+
+import math
+
+class Cushion(object):
+    # A bumper segment with everything the narrow phase needs precomputed as plain floats.
+
+    def __init__(self, segment):
+        self.segment = segment
+        direction = segment.point_b - segment.point_a
+        self.length = direction.Length()
+        direction = direction.Normalized()
+        normal = direction.RotatedCCW90()
+        self.ax = segment.point_a.x
+        self.ay = segment.point_a.y
+        self.bx = segment.point_b.x
+        self.by = segment.point_b.y
+        self.dx = direction.x
+        self.dy = direction.y
+        self.nx = normal.x
+        self.ny = normal.y
+
+    def closest_point(self, x, y):
+        t = (x - self.ax) * self.dx + (y - self.ay) * self.dy
+        if t <= 0.0:
+            return self.ax, self.ay
+        if t >= self.length:
+            return self.bx, self.by
+        return self.ax + self.dx * t, self.ay + self.dy * t
+
+    def overlaps_box(self, min_x, min_y, max_x, max_y, margin):
+        return min(self.ax, self.bx) - margin <= max_x and max(self.ax, self.bx) + margin >= min_x and \
+               min(self.ay, self.by) - margin <= max_y and max(self.ay, self.by) + margin >= min_y
+
+class CushionIndex(object):
+    # Answers "which cushions could a ball at this point be touching?"  Anything inside
+    # the safe rectangle is at least margin away from every cushion, so it gets nothing
+    # back at all; everything else is looked up in a coarse grid of cushion buckets.
+
+    def __init__(self, cushion_list, play_rect, bounds_rect, margin):
+        self.cushion_list = cushion_list
+        self.margin = margin
+        self.safe_min_x = play_rect.min_point.x + margin
+        self.safe_min_y = play_rect.min_point.y + margin
+        self.safe_max_x = play_rect.max_point.x - margin
+        self.safe_max_y = play_rect.max_point.y - margin
+
+        self.cell_size = 2.0 * margin
+        self.min_x = bounds_rect.min_point.x - margin
+        self.min_y = bounds_rect.min_point.y - margin
+        self.cols = int(math.ceil((bounds_rect.max_point.x + margin - self.min_x) / self.cell_size))
+        self.rows = int(math.ceil((bounds_rect.max_point.y + margin - self.min_y) / self.cell_size))
+        self.bucket_list = []
+        for j in range(self.rows):
+            for i in range(self.cols):
+                min_x = self.min_x + i * self.cell_size
+                min_y = self.min_y + j * self.cell_size
+                max_x = min_x + self.cell_size
+                max_y = min_y + self.cell_size
+                bucket = tuple(cushion for cushion in cushion_list if cushion.overlaps_box(min_x, min_y, max_x, max_y, margin))
+                self.bucket_list.append(bucket)
+
+    def query(self, x, y, radius):
+        if radius > self.margin:
+            return self.cushion_list
+        if self.safe_min_x < x < self.safe_max_x and self.safe_min_y < y < self.safe_max_y:
+            return ()
+        i = int(math.floor((x - self.min_x) / self.cell_size))
+        j = int(math.floor((y - self.min_y) / self.cell_size))
+        if i < 0 or j < 0 or i >= self.cols or j >= self.rows:
+            return self.cushion_list
+        return self.bucket_list[j * self.cols + i]
\ No newline at end of file
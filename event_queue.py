@@ -0,0 +1,52 @@
+# event_queue.py
+
+import threading
+
+class EventQueue(object):
+    # Collects simulation events on the physics thread and hands them over to the drawing
+    # thread in batches.  Its record method is meant to be the simulation's event callback:
+    # it appends an (event, intensity, x, y, ball number, other ball number) tuple to a list
+    # that only the physics thread touches, so there's no locking per contact.  The physics
+    # thread calls flush once per batch of steps to move them over, under the lock, and the
+    # drawing thread takes everything flushed so far.  Neither list grows past max_events;
+    # if nobody is taking events, the oldest are dropped.
+
+    def __init__(self, max_events=1024):
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.pending_list = []
+        self.ready_list = []
+        self.dropped_count = 0
+
+    def record(self, event, intensity, ball=None, other_ball=None):
+        if len(self.pending_list) >= self.max_events:
+            self.dropped_count += 1
+            return
+        x = y = 0.0
+        number = other_number = -1
+        if ball is not None:
+            position = ball.position
+            x = position.x
+            y = position.y
+            number = ball.number
+        if other_ball is not None:
+            other_number = other_ball.number
+        self.pending_list.append((event, intensity, x, y, number, other_number))
+
+    def flush(self):
+        pending_list = self.pending_list
+        if len(pending_list) == 0:
+            return
+        self.pending_list = []
+        with self.lock:
+            ready_list = self.ready_list
+            ready_list += pending_list
+            if len(ready_list) > self.max_events:
+                self.dropped_count += len(ready_list) - self.max_events
+                del ready_list[:len(ready_list) - self.max_events]
+
+    def take(self):
+        with self.lock:
+            ready_list = self.ready_list
+            self.ready_list = []
+        return ready_list
@@ -0,0 +1,308 @@
+# event_simulator.py
+
+import heapq
+import math
+
+from math2d_vector import Vector
+
+class EventDrivenSimulator(object):
+    # An alternative to PoolTable.advance_simulation that never takes a fixed time step.
+    # Friction is modeled as an exponential decay of velocity, v(t) = v0 * exp(-k * t),
+    # which integrates to p(t) = p0 + v0 * s(t) where s(t) = (1 - exp(-k * t)) / k.
+    # Since every ball shares the same s(t), the relative motion of any two balls, and the
+    # motion of a ball relative to a cushion or pocket, is a straight line in s.  That lets
+    # us solve for the exact time of every ball, cushion and pocket event, keep them all in
+    # a priority queue, and jump directly from one event to the next.  Predicted events are
+    # invalidated by bumping a per-ball version number whenever a ball's motion changes.
+    # The queue and the versions are kept from one call to the next, so that stepping a
+    # frame at a time costs no more than the events in it.  They are only rebuilt when the
+    # table's ball version says that something else has changed the balls since.
+
+    EVENT_BALL = 0
+    EVENT_CUSHION = 1
+    EVENT_CORNER = 2
+    EVENT_POCKET = 3
+    EVENT_REST = 4
+
+    def __init__(self, pool_table, decay_rate=0.3, rest_speed=1e-2, max_events=100000, approach_epsilon=1e-9):
+        # A decay rate of 0.3 is roughly what the fixed step simulation's friction of 0.995
+        # per step amounts to when it is stepped once a frame at 60 frames per second.
+        self.pool_table = pool_table
+        self.decay_rate = decay_rate
+        self.rest_speed = rest_speed
+        self.max_events = max_events
+        self.approach_epsilon = approach_epsilon
+        self.event_count = 0
+        self.capped = False
+        self.time = 0.0
+        self.ball_version = None
+        self.event_queue = []
+
+    def advance(self, elapsed_time, event_callback=None):
+        # If the event cap is hit, we stop at the last event rather than jump the balls past
+        # events nobody handled; the frame then ends early, and capped is set.
+        self._begin()
+        end_time = self.time + elapsed_time
+        self._process_events(end_time, event_callback)
+        if not self.capped:
+            self._advance_to(end_time)
+        self._end()
+
+    def simulate_to_rest(self, max_time=60.0, event_callback=None, stop_condition=None):
+        # Run until every ball has come to rest, until the given amount of time has passed,
+        # until the optional stop condition returns true after an event, or until the event
+        # cap is hit, and return the amount of simulated time that took.
+        self._begin()
+        start_time = self.time
+        end_time = start_time + max_time
+        self._process_events(end_time, event_callback, stop_condition)
+        if not (self.capped or self.is_settled() or (stop_condition is not None and stop_condition())):
+            self._advance_to(end_time)
+        self._end()
+        return self.time - start_time
+
+    def is_settled(self):
+        for i in range(len(self.ball_list)):
+            if self.active_list[i] and (self.vx[i] != 0.0 or self.vy[i] != 0.0):
+                return False
+        return True
+
+    def _process_events(self, end_time, event_callback, stop_condition=None):
+        while len(self.event_queue) > 0:
+            event = self.event_queue[0]
+            if event[0] > end_time:
+                break
+            if self._is_stale(event):
+                heapq.heappop(self.event_queue)
+                continue
+            if self.event_count >= self.max_events:
+                self.capped = True
+                break
+            heapq.heappop(self.event_queue)
+            self._advance_to(event[0])
+            self._handle_event(event, event_callback)
+            self.event_count += 1
+            if stop_condition is not None and stop_condition():
+                break
+
+    def _begin(self):
+        self.event_count = 0
+        self.capped = False
+        if self.ball_version != self.pool_table.ball_version:
+            self._rebuild()
+
+    def _rebuild(self):
+        self.time = 0.0
+        self.event_queue = []
+        self.sequence = 0
+        # Sorting by number makes the order of simultaneous events independent of the
+        # order of the table's ball list.
+        self.ball_list = sorted(self.pool_table.ball_list, key=lambda ball: ball.number)
+        self.active_list = [True] * len(self.ball_list)
+        self.version_list = [0] * len(self.ball_list)
+        self.px = []
+        self.py = []
+        self.vx = []
+        self.vy = []
+        for ball in self.ball_list:
+            position = ball.position
+            velocity = ball.velocity
+            self.px.append(position.x)
+            self.py.append(position.y)
+            self.vx.append(velocity.x)
+            self.vy.append(velocity.y)
+        self.radius_list = [ball.radius for ball in self.ball_list]
+        self.mass_list = [ball.mass for ball in self.ball_list]
+        self.pocket_list = [(pocket.center.x, pocket.center.y, pocket.radius) for pocket in self.pool_table.pocket_list]
+        for i in range(len(self.ball_list)):
+            self._predict(i, first_pass=True)
+
+    def _end(self):
+        for i in range(len(self.ball_list)):
+            if self.active_list[i]:
+                self._write_back(i)
+        self.ball_version = self.pool_table.ball_version
+
+    def _write_back(self, i):
+        ball = self.ball_list[i]
+        ball.position = Vector(self.px[i], self.py[i])
+        ball.velocity = Vector(self.vx[i], self.vy[i])
+
+    def _is_stale(self, event):
+        i, j = event[3], event[4]
+        if event[5] != self.version_list[i]:
+            return True
+        if event[2] == self.EVENT_BALL and event[6] != self.version_list[j]:
+            return True
+        return False
+
+    def _calc_travel(self, time):
+        # How far, in units of initial velocity, a ball travels in the given amount of time.
+        if self.decay_rate == 0.0:
+            return time
+        return -math.expm1(-self.decay_rate * time) / self.decay_rate
+
+    def _calc_time(self, travel):
+        # The inverse of _calc_travel; infinite if friction stops the ball short of it.
+        if self.decay_rate == 0.0:
+            return travel
+        x = self.decay_rate * travel
+        if x >= 1.0:
+            return float('inf')
+        return -math.log1p(-x) / self.decay_rate
+
+    def _advance_to(self, time):
+        delta_time = time - self.time
+        if delta_time <= 0.0:
+            return
+        travel = self._calc_travel(delta_time)
+        decay = math.exp(-self.decay_rate * delta_time)
+        for i in range(len(self.ball_list)):
+            if self.active_list[i]:
+                self.px[i] += self.vx[i] * travel
+                self.py[i] += self.vy[i] * travel
+                self.vx[i] *= decay
+                self.vy[i] *= decay
+        self.time = time
+
+    def _schedule(self, travel, kind, i, j, extra=None):
+        delta_time = self._calc_time(travel)
+        if delta_time == float('inf'):
+            return
+        version_j = self.version_list[j] if kind == self.EVENT_BALL else 0
+        heapq.heappush(self.event_queue, (self.time + delta_time, self.sequence, kind, i, j, self.version_list[i], version_j, extra))
+        self.sequence += 1
+
+    def _predict(self, i, first_pass=False):
+        if not self.active_list[i]:
+            return
+        px, py, vx, vy = self.px[i], self.py[i], self.vx[i], self.vy[i]
+        radius = self.radius_list[i]
+
+        # When a ball is at rest, only other balls can get it moving again.  All pairs are
+        # predicted from both sides, except on the first pass where we only need one side.
+        for j in range(i + 1 if first_pass else 0, len(self.ball_list)):
+            if j != i and self.active_list[j]:
+                travel = self._solve_circle(self.px[j] - px, self.py[j] - py, self.vx[j] - vx, self.vy[j] - vy, radius + self.radius_list[j])
+                if travel is not None:
+                    self._schedule(travel, self.EVENT_BALL, i, j)
+
+        speed = math.sqrt(vx * vx + vy * vy)
+        if speed == 0.0:
+            return
+
+        for j, cushion in enumerate(self.pool_table.cushion_list):
+            normal_speed = vx * cushion.nx + vy * cushion.ny
+            if normal_speed < -self.approach_epsilon:
+                height = (px - cushion.ax) * cushion.nx + (py - cushion.ay) * cushion.ny
+                if height >= 0.0:
+                    travel = max(0.0, (height - radius) / -normal_speed)
+                    t = (px + vx * travel - cushion.ax) * cushion.dx + (py + vy * travel - cushion.ay) * cushion.dy
+                    if 0.0 <= t <= cushion.length:
+                        self._schedule(travel, self.EVENT_CUSHION, i, j)
+            for k, (cx, cy) in enumerate(((cushion.ax, cushion.ay), (cushion.bx, cushion.by))):
+                travel = self._solve_circle(px - cx, py - cy, vx, vy, radius)
+                if travel is not None:
+                    self._schedule(travel, self.EVENT_CORNER, i, j, k)
+
+        for j, (cx, cy, pocket_radius) in enumerate(self.pocket_list):
+            if (cx - px) ** 2 + (cy - py) ** 2 < pocket_radius * pocket_radius:
+                travel = 0.0
+            else:
+                travel = self._solve_circle(cx - px, cy - py, -vx, -vy, pocket_radius)
+            if travel is not None:
+                self._schedule(travel, self.EVENT_POCKET, i, j)
+
+        if self.decay_rate > 0.0:
+            rest_time = max(0.0, math.log(speed / self.rest_speed) / self.decay_rate)
+            self._schedule(self._calc_travel(rest_time), self.EVENT_REST, i, i)
+
+    def _solve_circle(self, dx, dy, dvx, dvy, distance):
+        # Find the travel at which the relative position (dx, dy) + (dvx, dvy) * travel first
+        # comes within the given distance, provided that the two things are approaching.
+        # Approach speeds down in the round-off noise are ignored; otherwise balls resting
+        # against each other can trade tiny velocities back and forth forever.
+        b = dx * dvx + dy * dvy
+        if b >= -self.approach_epsilon * distance:
+            return None
+        a = dvx * dvx + dvy * dvy
+        c = dx * dx + dy * dy - distance * distance
+        if c <= 0.0:
+            return 0.0
+        discriminant = b * b - a * c
+        if discriminant < 0.0:
+            return None
+        return max(0.0, (-b - math.sqrt(discriminant)) / a)
+
+    def _reflect(self, i, nx, ny):
+        dot = self.vx[i] * nx + self.vy[i] * ny
+        if dot < 0.0:
+            self.vx[i] -= 2.0 * dot * nx
+            self.vy[i] -= 2.0 * dot * ny
+
+    def _bump(self, i):
+        self.version_list[i] += 1
+        self._predict(i)
+
+    def _handle_event(self, event, event_callback):
+        kind, i, j, extra = event[2], event[3], event[4], event[7]
+        if kind == self.EVENT_BALL:
+            self._resolve_ball_with_ball(i, j, event_callback)
+            self.version_list[i] += 1
+            self.version_list[j] += 1
+            self._predict(i)
+            self._predict(j)
+        elif kind == self.EVENT_CUSHION:
+            cushion = self.pool_table.cushion_list[j]
+            if event_callback is not None:
+                event_callback('ball_hit_bumper', math.sqrt(self.vx[i] ** 2 + self.vy[i] ** 2), self.ball_list[i], None)
+            self._reflect(i, cushion.nx, cushion.ny)
+            self._bump(i)
+        elif kind == self.EVENT_CORNER:
+            cushion = self.pool_table.cushion_list[j]
+            cx, cy = (cushion.ax, cushion.ay) if extra == 0 else (cushion.bx, cushion.by)
+            nx = self.px[i] - cx
+            ny = self.py[i] - cy
+            length = math.sqrt(nx * nx + ny * ny)
+            if length > 0.0:
+                if event_callback is not None:
+                    event_callback('ball_hit_bumper', math.sqrt(self.vx[i] ** 2 + self.vy[i] ** 2), self.ball_list[i], None)
+                self._reflect(i, nx / length, ny / length)
+            self._bump(i)
+        elif kind == self.EVENT_POCKET:
+            if event_callback is not None:
+                event_callback('ball_in_pocket', math.sqrt(self.vx[i] ** 2 + self.vy[i] ** 2), self.ball_list[i], None)
+            self._write_back(i)
+            self.active_list[i] = False
+            self.version_list[i] += 1
+            self.pool_table._pocket_ball(self.ball_list[i])
+        elif kind == self.EVENT_REST:
+            self.vx[i] = 0.0
+            self.vy[i] = 0.0
+            self._bump(i)
+
+    def _resolve_ball_with_ball(self, i, j, event_callback):
+        nx = self.px[j] - self.px[i]
+        ny = self.py[j] - self.py[i]
+        length = math.sqrt(nx * nx + ny * ny)
+        if length == 0.0:
+            return
+        nx /= length
+        ny /= length
+
+        if event_callback is not None:
+            event_callback('ball_hit_ball', math.sqrt((self.vx[j] - self.vx[i]) ** 2 + (self.vy[j] - self.vy[i]) ** 2), self.ball_list[i], self.ball_list[j])
+
+        mass_a = self.mass_list[i]
+        mass_b = self.mass_list[j]
+        total_mass = mass_a + mass_b
+        a_dot_n = self.vx[i] * nx + self.vy[i] * ny
+        b_dot_n = self.vx[j] * nx + self.vy[j] * ny
+
+        scale_a = 2.0 * mass_b / total_mass * b_dot_n + (((mass_a - mass_b) / total_mass) - 1.0) * a_dot_n
+        scale_b = 2.0 * mass_a / total_mass * a_dot_n + (((mass_b - mass_a) / total_mass) - 1.0) * b_dot_n
+
+        self.vx[i] += nx * scale_a
+        self.vy[i] += ny * scale_a
+        self.vx[j] += nx * scale_b
+        self.vy[j] += ny * scale_b
\ No newline at end of file
@@ -0,0 +1,40 @@
+# frame_scheduler.py
+
+class FrameScheduler(object):
+    # Runs the canvas's animation timer only while there's something to animate.  Each frame
+    # the canvas reports whether it was busy (balls moving, keys held, a replay running, and
+    # so on), and once it has been idle for the linger time the timer is stopped, so that a
+    # table sitting between shots costs nothing at all.  Anything that might change what's
+    # on the screen (a key press, a shot, the window being shown) must call wake, which puts
+    # the timer back at the full frame rate.  The linger time gives the drawing, which runs
+    # a step behind the simulation, a few frames to catch up with the final settled state.
+    # The timer only needs start(msec), stop() and isActive(), as a QTimer has.
+
+    def __init__(self, timer, frame_interval, linger_time=0.25):
+        self.timer = timer
+        self.frame_interval = frame_interval
+        self.linger_time = linger_time
+        self.idle_time = 0.0
+
+    def is_running(self):
+        return self.timer.isActive()
+
+    def wake(self):
+        # Returns true if the timer had been stopped, in which case the caller should forget
+        # about the time that went by while it was asleep.
+        self.idle_time = 0.0
+        if self.timer.isActive():
+            return False
+        self.timer.start(self.frame_interval)
+        return True
+
+    def update(self, busy, elapsed_time):
+        # Call once per frame; returns false if the timer has now been stopped.
+        if busy:
+            self.idle_time = 0.0
+            return True
+        self.idle_time += elapsed_time
+        if self.idle_time < self.linger_time:
+            return True
+        self.timer.stop()
+        return False
@@ -0,0 +1,201 @@
+# physics_thread.py
+
+import time
+import queue
+import threading
+import concurrent.futures
+
+from table_state import TableState
+from event_queue import EventQueue
+
+class PhysicsSnapshot(object):
+    # What the physics thread publishes after each batch of steps.  A snapshot is never
+    # changed once it has been published, so the drawing thread can read it at its leisure
+    # without any locking.
+
+    __slots__ = ['state', 'time', 'wall_time', 'settled']
+
+    def __init__(self, state, time, wall_time, settled):
+        self.state = state
+        self.time = time
+        self.wall_time = wall_time
+        self.settled = settled
+
+class PhysicsThread(object):
+    # Runs a pool table's simulation on its own thread in fixed time steps, independent of
+    # how fast or slow the drawing is.  The last two published snapshots are kept as a pair,
+    # which is swapped in one assignment, and the drawing thread interpolates between them.
+    # While the thread runs it owns the table: anything else that wants to read or change
+    # the table must submit a function to be called on the physics thread between steps.
+    # Events are queued, without any locking per event, for the drawing thread to take in
+    # batches whenever it likes, and the optional listeners, which are only ever called on
+    # the physics thread, see every event and every step.  When the table has settled, the
+    # thread sleeps until it is given work.  Note that, being a thread, it still shares the
+    # interpreter lock with the drawing.  If a simulator is given, it advances the table
+    # instead of advance_simulation.
+
+    def __init__(self, pool_table, time_step=1.0 / 60.0, max_steps_per_tick=8, settle_epsilon=1e-2, simulator=None):
+        self.pool_table = pool_table
+        self.simulator = simulator
+        self.time_step = time_step
+        self.max_steps_per_tick = max_steps_per_tick
+        self.settle_epsilon = settle_epsilon
+        self.event_listener = None
+        self.step_listener = None
+        self.paused = False
+        self.simulation_time = 0.0
+        self.command_queue = queue.Queue()
+        self.event_queue = EventQueue()
+        self.thread = None
+        self.running = False
+        snapshot = self._take_snapshot(time.perf_counter())
+        self.snapshot_pair = (snapshot, snapshot)
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.running = False
+            self.command_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, function, *args):
+        # Call function(pool_table, *args) on the physics thread and return a future for its
+        # result.  A snapshot reflecting the change is published before the future is done.
+        future = concurrent.futures.Future()
+        if self.thread is None:
+            self._finish([self._call(future, function, args)])
+        else:
+            self.command_queue.put((future, function, args))
+        return future
+
+    def call(self, function, *args):
+        return self.submit(function, *args).result()
+
+    def set_paused(self, paused):
+        return self.submit(self._set_paused, paused)
+
+    def _set_paused(self, pool_table, paused):
+        self.paused = paused
+
+    def latest_snapshot(self):
+        return self.snapshot_pair[1]
+
+    def take_events(self):
+        # Returns the events since the last call, as (event, intensity, x, y, ball number,
+        # other ball number) tuples in the order they happened.
+        return self.event_queue.take()
+
+    def interpolate(self, state, wall_time=None):
+        # Blend the last two snapshots into the given state for the given wall clock time.
+        # We draw one step behind the simulation, so this is always an interpolation and
+        # never a guess about the future.  Whether a ball is pocketed comes from the newer
+        # snapshot.  Returns the newer snapshot.
+        if wall_time is None:
+            wall_time = time.perf_counter()
+        previous, current = self.snapshot_pair
+        if state.number_list != current.state.number_list or previous.state.number_list != current.state.number_list:
+            state.copy_from(current.state)
+            return current
+        alpha = 1.0
+        if current.wall_time > previous.wall_time:
+            alpha = (wall_time - current.wall_time) / self.time_step
+            alpha = 0.0 if alpha < 0.0 else (1.0 if alpha > 1.0 else alpha)
+        data = state.data
+        previous_data = previous.state.data
+        current_data = current.state.data
+        data[0] = current_data[0]
+        j = 1
+        for i in range(len(current.state.number_list)):
+            for k in range(j, j + 4):
+                data[k] = previous_data[k] + (current_data[k] - previous_data[k]) * alpha
+            data[j + 4] = current_data[j + 4]
+            j += TableState.BALL_STRIDE
+        return current
+
+    def _take_snapshot(self, wall_time):
+        state = self.pool_table.save_state()
+        return PhysicsSnapshot(state, self.simulation_time, wall_time, self.pool_table.is_settled(self.settle_epsilon))
+
+    def _publish(self, wall_time, jump):
+        # A jump, such as a reset or an undo, replaces both snapshots so that we don't
+        # interpolate the balls across the table.
+        snapshot = self._take_snapshot(wall_time)
+        self.snapshot_pair = (snapshot if jump else self.snapshot_pair[1], snapshot)
+
+    def _call(self, future, function, args):
+        # Whatever the function did to the balls, the simulator has to hear about it.
+        try:
+            return future, function(self.pool_table, *args), None
+        except Exception as ex:
+            return future, None, ex
+        finally:
+            self.pool_table.mark_balls_changed()
+
+    def _finish(self, result_list):
+        self._publish(time.perf_counter(), True)
+        for future, result, error in result_list:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _event_callback(self, event, intensity, ball=None, other_ball=None):
+        self.event_queue.record(event, intensity, ball, other_ball)
+        if self.event_listener is not None:
+            self.event_listener(event, intensity, ball, other_ball)
+
+    def _run(self):
+        next_step_time = time.perf_counter()
+        while self.running:
+            # Sleep until the next step is due, or, if there's nothing to simulate, until
+            # someone gives us something to do.
+            idle = self.paused or self.latest_snapshot().settled
+            timeout = None if idle else max(next_step_time - time.perf_counter(), 0.0)
+            try:
+                command = self.command_queue.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if not self.running:
+                break
+
+            result_list = []
+            while command is not None:
+                result_list.append(self._call(*command))
+                try:
+                    command = self.command_queue.get_nowait()
+                except queue.Empty:
+                    command = None
+            if len(result_list) > 0:
+                self._finish(result_list)
+
+            now = time.perf_counter()
+            if idle or self.paused:
+                next_step_time = now
+                continue
+
+            # Without a listener, events go straight into the queue.
+            event_callback = self.event_queue.record if self.event_listener is None else self._event_callback
+            step_count = 0
+            while next_step_time <= now and step_count < self.max_steps_per_tick:
+                if self.simulator is not None:
+                    self.simulator.advance(self.time_step, event_callback)
+                else:
+                    self.pool_table.advance_simulation(self.time_step, event_callback)
+                self.simulation_time += self.time_step
+                if self.step_listener is not None:
+                    self.step_listener(self.pool_table, self.time_step)
+                next_step_time += self.time_step
+                step_count += 1
+            if step_count == self.max_steps_per_tick and next_step_time < now:
+                # We can't keep up, so let the simulation fall behind the clock rather
+                # than trying to catch up forever.
+                next_step_time = now
+            if step_count > 0:
+                self.event_queue.flush()
+                self._publish(time.perf_counter(), False)
@@ -0,0 +1,52 @@
+# pocket_index.py
+
+class PocketIndex(object):
+    # Answers "has a ball moving along this path fallen into a pocket?"  Each pocket is kept
+    # as its center and squared radius.  Every pocket lies outside of the play rectangle, or
+    # only just pokes into it, so we shrink the play rectangle by the furthest any pocket
+    # reaches into it, and a path lying inside of that safe rectangle can't touch a pocket.
+    # Since the rectangle is convex, a path is inside of it if both of its ends are.
+
+    def __init__(self, pocket_list, play_rect):
+        self.region_list = [(pocket.center.x, pocket.center.y, pocket.radius * pocket.radius) for pocket in pocket_list]
+        min_x = play_rect.min_point.x
+        min_y = play_rect.min_point.y
+        max_x = play_rect.max_point.x
+        max_y = play_rect.max_point.y
+        margin = 0.0
+        for pocket in pocket_list:
+            # How far the pocket's center is beyond each side that it is beyond, and so how
+            # far the pocket can reach back past that side.
+            center = pocket.center
+            distance_list = [distance for distance in (min_x - center.x, min_y - center.y, center.x - max_x, center.y - max_y) if distance >= 0.0]
+            if len(distance_list) == 0:
+                margin = float('inf')
+                break
+            margin = max(margin, pocket.radius - max(distance_list))
+        self.safe_min_x = min_x + margin
+        self.safe_min_y = min_y + margin
+        self.safe_max_x = max_x - margin
+        self.safe_max_y = max_y - margin
+
+    def is_safe(self, x, y):
+        return self.safe_min_x < x < self.safe_max_x and self.safe_min_y < y < self.safe_max_y
+
+    def find_pocket(self, x, y, delta_x=0.0, delta_y=0.0):
+        # Returns the index of the first pocket touched by the path that ends at (x, y) after
+        # moving by (delta_x, delta_y), or -1 if there is none.
+        start_x = x - delta_x
+        start_y = y - delta_y
+        if self.is_safe(x, y) and self.is_safe(start_x, start_y):
+            return -1
+        length_squared = delta_x * delta_x + delta_y * delta_y
+        for i, (center_x, center_y, radius_squared) in enumerate(self.region_list):
+            # Find the point on the path closest to the pocket's center.
+            t = 1.0
+            if length_squared > 0.0:
+                t = ((center_x - start_x) * delta_x + (center_y - start_y) * delta_y) / length_squared
+                t = 0.0 if t < 0.0 else (1.0 if t > 1.0 else t)
+            offset_x = start_x + delta_x * t - center_x
+            offset_y = start_y + delta_y * t - center_y
+            if offset_x * offset_x + offset_y * offset_y < radius_squared:
+                return i
+        return -1
@@ -4,41 +4,57 @@ import math
 import random
 
 from ball import Ball
-from OpenGL.GL import *
+from spatial_grid import SpatialGrid, balls_overlap
+from cushion_index import Cushion, CushionIndex
+from pocket_index import PocketIndex
+from shot_result import ShotResult
+from work_queue import WorkQueue
+from table_state import TableState
 from math2d_vector import Vector
 from math2d_line_segment import LineSegment
 from math2d_aa_rect import AxisAlignedRectangle
 from math2d_circle import Circle
 
 class PoolTable(object):
-    def __init__(self, pocket_radius, ball_radius=None, cue_ball_mass=0.17, other_ball_mass=0.16):
+    def __init__(self, pocket_radius, ball_radius=None, cue_ball_mass=0.17, other_ball_mass=0.16, rng=None):
+        # All randomness (racking and cue ball placement) comes from this generator, so a
+        # table given a seeded random.Random always plays out exactly the same way.
+        self.rng = rng if rng is not None else random.Random()
         self.pocket_radius = pocket_radius
         self.ball_radius = pocket_radius / 2.0 if ball_radius is None else ball_radius
         self.cue_ball_mass = cue_ball_mass
         self.other_ball_mass = other_ball_mass
         self._recalculate_geometry()
+        self.ball_grid = SpatialGrid(2.0 * self.ball_radius)
         self.ball_list = []
         self.pocketed_balls_list = []
+        self.ball_map = {}
+        self.ball_slot_map = {}
+        self.ball_version = 0
         self.reset_balls()
         self.max_advance_distance = self.ball_radius
         self.friction = 0.995
+        self.profiler = None
+        self.contact_solver = None
     
     def find_cue_ball(self):
-        i = self.find_ball(0)
-        if i is not None:
-            return self.ball_list[i]
+        ball = self.ball_map.get(0)
+        if ball is not None and not ball.pocketed:
+            return ball
+    
+    def get_ball(self, number):
+        # Returns the ball with the given number, whether or not it has been pocketed.
+        return self.ball_map.get(number)
     
     def find_ball(self, number):
-        for i in range(len(self.ball_list)):
-            ball = self.ball_list[i]
-            if ball.number == number:
-                return i
+        ball = self.ball_map.get(number)
+        if ball is not None and not ball.pocketed:
+            return self.ball_slot_map[number]
     
     def find_pocketed_ball(self, number):
-        for i in range(len(self.pocketed_balls_list)):
-            ball = self.pocketed_balls_list[i]
-            if ball.number == number:
-                return i
+        ball = self.ball_map.get(number)
+        if ball is not None and ball.pocketed:
+            return self.ball_slot_map[number]
     
     def yield_rack_positions(self):
         translate = Vector(-1.3, 0.0)
@@ -65,49 +81,62 @@ class PoolTable(object):
             for j in range(0, 4):
                 yield line_segment.Lerp(float(j) / 4.0) + translate
     
+    def mark_balls_changed(self):
+        # Anything that changes the balls from outside of the simulation must call this (the
+        # table's own methods already do), so that a simulator which keeps its own copy of
+        # the balls between steps, like the event driven one, knows to start over.
+        self.ball_version += 1
+    
+    def strike_cue_ball(self, cue_velocity):
+        cue_ball = self.find_cue_ball()
+        if cue_ball is not None:
+            cue_ball.velocity = cue_ball.velocity + cue_velocity
+            self.mark_balls_changed()
+    
     def replace_cue_ball(self):
         i = self.find_pocketed_ball(0)
         if i is None:
             return
         
+        self.mark_balls_changed()
         cue_ball = self.pocketed_balls_list[i]
-        self.pocketed_balls_list.pop(i)
-        self.ball_list.append(cue_ball)
+        self._unpocket_ball(cue_ball)
         cue_ball.velocity = Vector(0.0, 0.0)
         
-        rect = AxisAlignedRectangle(min_point=Vector(-2.0, -1.0), max_point=Vector(2.0, 1.0))
+        self.ball_grid.rebuild(self.ball_list)
         while True:
-            cue_ball.position = rect.RandomPoint()
+            cue_ball.position = Vector(
+                self.rng.uniform(self.play_rect.min_point.x, self.play_rect.max_point.x),
+                self.rng.uniform(self.play_rect.min_point.y, self.play_rect.max_point.y))
             
-            ball_a, ball_b = self._find_random_ball_with_ball_collision()
-            if ball_a is not None and ball_b is not None:
+            # Only the cue ball moves here, so it is the only ball we need to re-test.
+            self.ball_grid.update(cue_ball)
+            if len(self.ball_grid.find_contacts_with(cue_ball)) > 0:
                 continue
         
-            ball, contact_point, contact_normal = self._find_random_ball_with_bumper_collision()
-            if ball is not None:
+            contact_point, contact_normal = self._find_bumper_contact(cue_ball)
+            if contact_point is not None:
                 continue
             
             break
     
     def reset_balls(self):
-        for ball in self.pocketed_balls_list + self.ball_list:
-            ball.release_texture()
-        
         self.pocketed_balls_list = []
         self.ball_list = []
         
+        ball_map = {}
         for i in range(0, 16):
             mass = self.cue_ball_mass if i == 0 else self.other_ball_mass
-            ball = Ball(self.ball_radius, mass, i)
-            ball.load_texture()
-            self.ball_list.append(ball)
+            ball = self._create_ball(self.ball_radius, mass, i)
+            ball_map[i] = ball
         
-        cue_ball = self.ball_list.pop(self.find_ball(0))
+        cue_ball = ball_map.pop(0)
         cue_ball.position = Vector(1.7, 0.0)
         cue_ball.velocity = Vector(0.0, 0.0)
         
-        ball_8 = self.ball_list.pop(self.find_ball(8))
-        random.shuffle(self.ball_list)
+        ball_8 = ball_map.pop(8)
+        self.ball_list = [ball_map[number] for number in sorted(ball_map)]
+        self.rng.shuffle(self.ball_list)
         self.ball_list.insert(0, ball_8)
         
         j = 0
@@ -118,6 +147,90 @@ class PoolTable(object):
             j += 1
         
         self.ball_list.append(cue_ball)
+        self._rebuild_ball_index()
+    
+    def clear_balls(self):
+        # Take every ball off of the table, e.g., to set up a custom table with add_ball.
+        self.ball_list = []
+        self.pocketed_balls_list = []
+        self._rebuild_ball_index()
+    
+    def add_ball(self, number, position, velocity=None, mass=None, radius=None):
+        if number in self.ball_map:
+            raise ValueError('There is already a ball numbered %d.' % number)
+        if mass is None:
+            mass = self.cue_ball_mass if number == 0 else self.other_ball_mass
+        ball = self._create_ball(self.ball_radius if radius is None else radius, mass, number)
+        ball.position = position
+        ball.velocity = Vector(0.0, 0.0) if velocity is None else velocity
+        self.ball_list.append(ball)
+        self._rebuild_ball_index()
+        return ball
+    
+    def _rebuild_ball_index(self):
+        # The ball map finds any ball by number, and the slot map gives its index in
+        # whichever of the two lists it is currently in, so that lookups and moves
+        # between the lists never have to scan.
+        self.ball_map = {}
+        self.ball_slot_map = {}
+        for ball_list, pocketed in ((self.ball_list, False), (self.pocketed_balls_list, True)):
+            for i in range(len(ball_list)):
+                ball = ball_list[i]
+                ball.pocketed = pocketed
+                self.ball_map[ball.number] = ball
+                self.ball_slot_map[ball.number] = i
+        self.state_ball_list = [self.ball_map[number] for number in sorted(self.ball_map)]
+        self.state_number_list = tuple(ball.number for ball in self.state_ball_list)
+        self.mark_balls_changed()
+    
+    def save_state(self, state=None, mode=0):
+        # Write the state of every ball into the given snapshot, or into a new one if none
+        # is given, and return it.  Reusing a snapshot makes saving allocation free.
+        if state is None:
+            state = TableState(self.state_number_list)
+        elif state.number_list != self.state_number_list:
+            raise ValueError('Table state does not match the balls on this table.')
+        data = state.data
+        data[0] = mode
+        j = 1
+        for ball in self.state_ball_list:
+            data[j], data[j + 1], data[j + 2], data[j + 3] = self._read_ball_state(ball)
+            data[j + 4] = 1.0 if ball.pocketed else 0.0
+            j += TableState.BALL_STRIDE
+        return state
+    
+    def restore_state(self, state):
+        # Put every ball back the way it was when the snapshot was taken, and return the
+        # mode that was saved with it.
+        if state.number_list != self.state_number_list:
+            raise ValueError('Table state does not match the balls on this table.')
+        self.mark_balls_changed()
+        data = state.data
+        j = 1
+        for ball in self.state_ball_list:
+            self._write_ball_state(ball, data[j], data[j + 1], data[j + 2], data[j + 3])
+            pocketed = data[j + 4] != 0.0
+            if pocketed != ball.pocketed:
+                if pocketed:
+                    self._pocket_ball(ball)
+                else:
+                    self._unpocket_ball(ball)
+            j += TableState.BALL_STRIDE
+        return int(data[0])
+    
+    def _read_ball_state(self, ball):
+        position = ball.position
+        velocity = ball.velocity
+        return position.x, position.y, velocity.x, velocity.y
+    
+    def _write_ball_state(self, ball, x, y, velocity_x, velocity_y):
+        # Update the vectors in place rather than allocating new ones.
+        position = ball.position
+        position.x = x
+        position.y = y
+        velocity = ball.velocity
+        velocity.x = velocity_x
+        velocity.y = velocity_y
 
     def _recalculate_geometry(self):
         sqrt2 = math.sqrt(2.0)
@@ -160,27 +273,13 @@ class PoolTable(object):
         self.border_rect = AxisAlignedRectangle()
         self.border_rect.max_point = Vector(2.0 + offset, 1.0 + offset)
         self.border_rect.min_point = Vector(-2.0 - offset, -1.0 - offset)
-    
-    def draw(self):
-        
-        # Draw the bumpers.
-        glBegin(GL_LINES)
-        try:
-            glColor3f(1.0, 1.0, 1.0)
-            for segment in self.segment_list:
-                glVertex2f(segment.point_a.x, segment.point_a.y)
-                glVertex2f(segment.point_b.x, segment.point_b.y)
-        finally:
-            glEnd()
-        
-        # Draw the pockets.
-        glColor3f(0.5, 0.5, 0.5)
-        for pocket in self.pocket_list:
-            pocket.Render()
+        self.play_rect = AxisAlignedRectangle(min_point=Vector(-2.0, -1.0), max_point=Vector(2.0, 1.0))
         
-        # Draw the balls.
-        for ball in self.ball_list:
-            ball.render()
+        # Every bumper lies outside of the play rectangle, so the cushion index can tell
+        # right away that a ball well inside of it is not touching any of them.
+        self.cushion_list = [Cushion(segment) for segment in self.segment_list]
+        self.cushion_index = CushionIndex(self.cushion_list, self.play_rect, self.border_rect, self.ball_radius)
+        self.pocket_index = PocketIndex(self.pocket_list, self.play_rect)
     
     def _calc_max_speed(self):
         max_speed = 0.0
@@ -194,6 +293,20 @@ class PoolTable(object):
         max_speed = self._calc_max_speed()
         return True if max_speed < epsilon else False
     
+    def simulate_to_rest(self, max_time=60.0, event_callback=None, stop_condition=None, time_step=1.0 / 60.0, epsilon=1e-2):
+        # Run whole frames of advance_simulation, just as the physics thread does, until every
+        # ball has come to rest, until the given amount of time has passed, or until the
+        # optional stop condition returns true after a frame, and return the amount of
+        # simulated time that took.  This gives the table the same interface as a simulator.
+        elapsed_time = 0.0
+        while elapsed_time < max_time and not self.is_settled(epsilon):
+            delta_time = min(time_step, max_time - elapsed_time)
+            self.advance_simulation(delta_time, event_callback)
+            elapsed_time += delta_time
+            if stop_condition is not None and stop_condition():
+                break
+        return elapsed_time
+    
     def advance_simulation(self, elapsed_time, event_callback=None):
     
         # To prevent tunnelling, we need to know how fast the fastest ball is moving,
@@ -207,10 +320,72 @@ class PoolTable(object):
         else:
             time_step = elapsed_time
         
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_frame()
+        
         while elapsed_time > 0.0:
             delta_time = time_step if time_step < elapsed_time else elapsed_time
             self._advance_balls(delta_time, event_callback)
             elapsed_time -= delta_time
+        
+        if profiler is not None:
+            profiler.end_frame()
+    
+    def simulate_shot(self, cue_velocity=None, max_time=60.0, time_step=1.0 / 60.0, stop_on_cue_ball_pocketed=False, stop_on_first_contact=False, simulator=None, epsilon=1e-2):
+        # Synchronously run the simulation from the table's current state until it settles,
+        # until max_time simulated seconds have passed, or until one of the optional early
+        # exit conditions is met.  The table is left in its final state.  The time step plays
+        # the role of the frame time; substeps are chosen just as advance_simulation would.
+        # If an event driven simulator is given, it is used instead of fixed substeps, and the
+        # shot also stops if it hits the simulator's event cap.
+        result = ShotResult()
+        
+        if cue_velocity is not None:
+            self.strike_cue_ball(cue_velocity)
+        
+        def should_stop():
+            if stop_on_cue_ball_pocketed and result.cue_ball_pocketed:
+                result.stop_reason = ShotResult.STOP_CUE_BALL_POCKETED
+                return True
+            if stop_on_first_contact and result.first_contact is not None:
+                result.stop_reason = ShotResult.STOP_FIRST_CONTACT
+                return True
+            return False
+        
+        if simulator is not None:
+            result.elapsed_time = simulator.simulate_to_rest(max_time, result.record_event, should_stop)
+            if result.stop_reason is None:
+                if simulator.capped:
+                    result.stop_reason = ShotResult.STOP_MAX_EVENTS
+                else:
+                    result.stop_reason = ShotResult.STOP_SETTLED if simulator.is_settled() else ShotResult.STOP_MAX_TIME
+        else:
+            elapsed_time = 0.0
+            record_event = result.record_event
+            while True:
+                max_speed = self._calc_max_speed()
+                if max_speed < epsilon:
+                    result.stop_reason = ShotResult.STOP_SETTLED
+                    break
+                if elapsed_time >= max_time:
+                    result.stop_reason = ShotResult.STOP_MAX_TIME
+                    break
+                delta_time = min(time_step, max_time - elapsed_time)
+                if max_speed * delta_time > self.max_advance_distance:
+                    delta_time = self.max_advance_distance / max_speed
+                self._advance_balls(delta_time, record_event)
+                elapsed_time += delta_time
+                if should_stop():
+                    break
+            result.elapsed_time = elapsed_time
+        
+        cue_ball = self.find_cue_ball()
+        if cue_ball is not None:
+            position = cue_ball.position
+            result.cue_ball_position = (position.x, position.y)
+        
+        return result
     
     def _advance_balls(self, delta_time, event_callback=None):
         # We begin with the assumption that no ball is in collision with any other, or any bumper.
@@ -219,94 +394,267 @@ class PoolTable(object):
         # We're going to approximate the time of impact and the contact normal.
         # After this call, nothing should be in collision with anything else.
         
+        self.mark_balls_changed()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_substep()
+        
         # Move all the balls.
-        for ball in self.ball_list:
-            ball.position += ball.velocity * delta_time
+        self._integrate_balls(delta_time)
+        if profiler is not None:
+            profiler.mark('integrate')
+        
+        # Remove any balls whose path crossed a pocket, even if they went on past it.
+        self._pocket_balls(self.ball_list, event_callback, delta_time)
+        if profiler is not None:
+            profiler.mark('pocket')
         
         # Go find and resolve all collisions.
+        self._resolve_collisions(event_callback)
+        if profiler is not None:
+            profiler.mark('collide')
+        
+        # Remove any balls that were pushed into a pocket.
+        self._pocket_balls(self.ball_list, event_callback)
+        if profiler is not None:
+            profiler.mark('pocket')
+        
+        # Lastly, simulate friction with a simple scale.
+        self._apply_friction()
+        if profiler is not None:
+            profiler.mark('friction')
+    
+    def _pocket_balls(self, ball_list, event_callback=None, delta_time=0.0):
+        # Pocket whichever of the given balls have fallen into a pocket, and return them.
+        # Given the time step just taken, the whole path each ball took over it is tested.
+        if self.profiler is not None:
+            self.profiler.count('pocket_tests', len(ball_list))
+        pocket_index = self.pocket_index
+        remove_ball_list = []
+        for ball in self._select_pocket_candidates(ball_list, delta_time):
+            x, y, velocity_x, velocity_y = self._read_ball_state(ball)
+            if pocket_index.find_pocket(x, y, velocity_x * delta_time, velocity_y * delta_time) >= 0:
+                remove_ball_list.append(ball)
+        for ball in remove_ball_list:
+            if event_callback is not None:
+                event_callback('ball_in_pocket', ball.velocity.Length(), ball, None)
+            self._pocket_ball(ball)
+        return remove_ball_list
+    
+    def _select_pocket_candidates(self, ball_list, delta_time):
+        # Which of the given balls might have fallen into a pocket over the time step just
+        # taken.  Here that's all of them, and it's left to the pocket index to say.
+        return ball_list
+    
+    def _select_cushion_candidates(self, ball_list):
+        # Which of the given balls might be touching a cushion.  Here that's all of them,
+        # and it's left to the cushion index to say.
+        return ball_list
+    
+    def _create_ball(self, radius, mass, number):
+        return Ball(radius, mass, number)
+    
+    def _integrate_balls(self, delta_time):
+        for ball in self.ball_list:
+            ball.position += ball.velocity * delta_time
+    
+    def _apply_friction(self):
+        for ball in self.ball_list:
+            ball.velocity *= self.friction
+    
+    def _pocket_ball(self, ball):
+        self._remove_ball_from_list(self.ball_list, ball)
+        self._append_ball_to_list(self.pocketed_balls_list, ball)
+        ball.pocketed = True
+    
+    def _unpocket_ball(self, ball):
+        self._remove_ball_from_list(self.pocketed_balls_list, ball)
+        self._append_ball_to_list(self.ball_list, ball)
+        ball.pocketed = False
+    
+    def _remove_ball_from_list(self, ball_list, ball):
+        # Swap the last ball into the removed ball's slot so that removal is O(1).
+        i = self.ball_slot_map[ball.number]
+        last_ball = ball_list.pop()
+        if last_ball is not ball:
+            ball_list[i] = last_ball
+            self.ball_slot_map[last_ball.number] = i
+    
+    def _append_ball_to_list(self, ball_list, ball):
+        self.ball_slot_map[ball.number] = len(ball_list)
+        ball_list.append(ball)
+    
+    def _resolve_collisions(self, event_callback=None):
+        # Rather than rescanning every pair after each resolved contact, we keep a work queue
+        # of overlapping pairs found by the grid, and a work queue of balls that still need to
+        # be tested against the bumpers.  Resolving a contact only moves the balls involved, so
+        # only the pairs and bumper tests touching those balls need to be looked at again.
+        # Both queues are ordered by ball number, so the order in which contacts get resolved
+        # depends only on the state of the table and never on the order of the ball list.
+        # If a contact solver is set, it resolves the contacts instead, in bounded work.
+        self.ball_grid.rebuild(self.ball_list)
+        contact_list = self._find_contacts(self.ball_grid)
+        cushion_ball_list = self._select_cushion_candidates(self.ball_list)
+        if self.contact_solver is not None:
+            self.contact_solver.solve(self.ball_grid, contact_list, cushion_ball_list, event_callback)
+            return
+        contact_queue = WorkQueue()
+        for ball_a, ball_b in contact_list:
+            self._push_contact(contact_queue, ball_a, ball_b)
+        bumper_queue = WorkQueue()
+        for ball in cushion_ball_list:
+            bumper_queue.push(ball.number, ball)
+        self._resolve_queued_collisions(self.ball_grid, contact_queue, bumper_queue, event_callback)
+    
+    def _resolve_queued_collisions(self, ball_grid, contact_queue, bumper_queue, event_callback=None):
+        # Work through the queued contacts until none are left, queueing up whatever new
+        # contacts each resolution makes.
+        # When profiling, we count resolve passes the way the contact solver counts sweeps:
+        # contacts present from the start are resolved in the first pass, and a contact one
+        # of whose balls was last moved in pass n is resolved in pass n + 1.  The number of
+        # passes is the last one reached.
+        # Settling a cluster can take the same pair several small pushes in one substep, but
+        # to anyone listening that is one collision, so each pair is only reported once, at
+        # its first and hardest impact.
+        profiler = self.profiler
+        pass_map = None if profiler is None else {}
+        pass_count = 0
+        cushion_test_count = 0
+        hit_pair_set = set()
         while True:
-            ball_a, ball_b = self._find_random_ball_with_ball_collision()
-            if ball_a is not None and ball_b is not None:
-                event_callback('ball_hit_ball', (ball_b.velocity - ball_a.velocity).Length())
+            if len(contact_queue) > 0:
+                ball_a, ball_b = contact_queue.pop()
+                if not self._balls_overlap(ball_a, ball_b):
+                    continue
+                if event_callback is not None:
+                    pair_key = (ball_a.number, ball_b.number)
+                    if pair_key not in hit_pair_set:
+                        hit_pair_set.add(pair_key)
+                        event_callback('ball_hit_ball', (ball_b.velocity - ball_a.velocity).Length(), ball_a, ball_b)
                 self._resolve_ball_with_ball_collision(ball_a, ball_b)
+                if pass_map is not None:
+                    resolve_pass = max(pass_map.get(ball_a, 0), pass_map.get(ball_b, 0)) + 1
+                    pass_map[ball_a] = pass_map[ball_b] = resolve_pass
+                    pass_count = max(pass_count, resolve_pass)
+                for ball in (ball_a, ball_b):
+                    ball_grid.update(ball)
+                    for contact_ball_a, contact_ball_b in self._find_contacts(ball_grid, ball):
+                        self._push_contact(contact_queue, contact_ball_a, contact_ball_b)
+                    bumper_queue.push(ball.number, ball)
                 continue
             
-            ball, contact_point, contact_normal = self._find_random_ball_with_bumper_collision()
-            if ball is not None:
-                event_callback('ball_hit_bumper', ball.velocity.Length())
+            if len(bumper_queue) > 0:
+                cushion_test_count += 1
+                ball = bumper_queue.pop()
+                contact_point, contact_normal = self._find_bumper_contact(ball)
+                if contact_point is None:
+                    continue
+                if event_callback is not None:
+                    event_callback('ball_hit_bumper', ball.velocity.Length(), ball, None)
                 self._resolve_ball_with_bumper_collision(ball, contact_point, contact_normal)
+                if pass_map is not None:
+                    resolve_pass = pass_map.get(ball, 0) + 1
+                    pass_map[ball] = resolve_pass
+                    pass_count = max(pass_count, resolve_pass)
+                ball_grid.update(ball)
+                for contact_ball_a, contact_ball_b in self._find_contacts(ball_grid, ball):
+                    self._push_contact(contact_queue, contact_ball_a, contact_ball_b)
+                bumper_queue.push(ball.number, ball)
                 continue
             
             break
         
-        # Remove any pocketed balls.
-        remove_ball_list = []
-        for ball in self.ball_list:
-            for pocket in self.pocket_list:
-                if pocket.ContainsPoint(ball.position):
-                    remove_ball_list.append(ball)
-        for ball in remove_ball_list:
-            self.ball_list.remove(ball)
-            self.pocketed_balls_list.append(ball)
-            event_callback('ball_in_pocket', ball.velocity.Length())
-        
-        # Lastly, simulate friction with a simple scale.
-        for ball in self.ball_list:
-            ball.velocity *= self.friction
+        if profiler is not None:
+            profiler.count('resolve_iterations', pass_count)
+            profiler.count('cushion_tests', cushion_test_count)
     
-    def _find_random_ball_with_bumper_collision(self, epsilon=1e-7):
-        random.shuffle(self.ball_list)
-        for ball in self.ball_list:
-            contact_segment_list = []
-            for segment in self.segment_list:
-                if segment.Distance(ball.position) < ball.radius - epsilon:
-                    contact_segment_list.append(segment)
-            if len(contact_segment_list) > 0:
-                contact_normal = Vector(0.0, 0.0)
-                contact_point = Vector(0.0, 0.0)
-                for segment in contact_segment_list:
-                    contact_normal += (segment.point_b - segment.point_a).RotatedCCW90().Normalized()
-                    contact_point += segment.ClosestPoint(ball.position)
-                contact_normal.Normalize()
-                contact_point.Scale(1.0 / float(len(contact_segment_list)))
-                return ball, contact_point, contact_normal
-        return None, None, None
+    def _find_contacts(self, ball_grid, ball=None):
+        # Every overlapping pair in the grid, or only those with the given ball.  This is the
+        # one place pair tests are counted: one for every pair the grid looks at.
+        if ball is None:
+            if self.profiler is not None:
+                self.profiler.count('pair_tests', ball_grid.count_pair_tests())
+            return ball_grid.find_contacts()
+        if self.profiler is not None:
+            self.profiler.count('pair_tests', ball_grid.count_neighbours(ball))
+        return ball_grid.find_contacts_with(ball)
     
-    def _resolve_ball_with_bumper_collision(self, ball, contact_point, contact_normal):
-        ball.velocity = ball.velocity - contact_normal * 2.0 * ball.velocity.Dot(contact_normal)
-        ball.position = ball.position + contact_normal * (ball.radius - (ball.position - contact_point).Length())
+    def _balls_overlap(self, ball_a, ball_b):
+        return balls_overlap(ball_a, ball_b)
     
-    def _find_random_ball_with_ball_collision(self, epsilon=1e-7):
-        random.shuffle(self.ball_list)
-        for i in range(len(self.ball_list)):
-            ball_a = self.ball_list[i]
-            for j in range(i + 1, len(self.ball_list)):
-                ball_b = self.ball_list[j]
-                if (ball_a.position - ball_b.position).Length() < ball_a.radius + ball_b.radius - epsilon:
-                    return ball_a, ball_b
-        return None, None
+    def _push_contact(self, contact_queue, ball_a, ball_b):
+        if ball_a.number > ball_b.number:
+            ball_a, ball_b = ball_b, ball_a
+        contact_queue.push((ball_a.number, ball_b.number), (ball_a, ball_b))
     
-    def _resolve_ball_with_ball_collision(self, ball_a, ball_b):
-        contact_normal = ball_b.position - ball_a.position
+    def _find_bumper_contact(self, ball, epsilon=1e-7):
+        x, y, velocity_x, velocity_y = self._read_ball_state(ball)
+        cushion_list = self.cushion_index.query(x, y, ball.radius)
+        if len(cushion_list) == 0:
+            return None, None
+        
+        contact_distance = ball.radius - epsilon
+        contact_distance *= contact_distance
+        contact_count = 0
+        point_x = point_y = normal_x = normal_y = 0.0
+        for cushion in cushion_list:
+            closest_x, closest_y = cushion.closest_point(x, y)
+            delta_x = x - closest_x
+            delta_y = y - closest_y
+            if delta_x * delta_x + delta_y * delta_y < contact_distance:
+                contact_count += 1
+                point_x += closest_x
+                point_y += closest_y
+                normal_x += cushion.nx
+                normal_y += cushion.ny
+        
+        if contact_count == 0:
+            return None, None
+        
+        contact_point = Vector(point_x / float(contact_count), point_y / float(contact_count))
+        contact_normal = Vector(normal_x, normal_y)
         contact_normal.Normalize()
+        return contact_point, contact_normal
+    
+    def _resolve_ball_with_bumper_collision(self, ball, contact_point, contact_normal):
+        # The narrow phase works on plain floats, through the same state hooks as saving and
+        # restoring, so that a table can keep its balls however it likes.
+        x, y, velocity_x, velocity_y = self._read_ball_state(ball)
+        normal_x = contact_normal.x
+        normal_y = contact_normal.y
+        dot = velocity_x * normal_x + velocity_y * normal_y
+        velocity_x -= normal_x * 2.0 * dot
+        velocity_y -= normal_y * 2.0 * dot
+        offset_x = x - contact_point.x
+        offset_y = y - contact_point.y
+        depth = ball.radius - math.sqrt(offset_x * offset_x + offset_y * offset_y)
+        self._write_ball_state(ball, x + normal_x * depth, y + normal_y * depth, velocity_x, velocity_y)
+    
+    def _resolve_ball_with_ball_collision(self, ball_a, ball_b):
+        ax, ay, avx, avy = self._read_ball_state(ball_a)
+        bx, by, bvx, bvy = self._read_ball_state(ball_b)
+        delta_x = bx - ax
+        delta_y = by - ay
+        distance = math.sqrt(delta_x * delta_x + delta_y * delta_y)
+        normal_x = delta_x / distance
+        normal_y = delta_y / distance
         
-        total_mass = ball_a.mass + ball_b.mass
+        mass_a = ball_a.mass
+        mass_b = ball_b.mass
+        total_mass = mass_a + mass_b
         
-        b_dot_n = ball_b.velocity.Dot(contact_normal)
-        a_dot_n = ball_a.velocity.Dot(contact_normal)
+        b_dot_n = bvx * normal_x + bvy * normal_y
+        a_dot_n = avx * normal_x + avy * normal_y
         
-        scale = 2.0 * ball_b.mass / total_mass * b_dot_n
-        scale += (((ball_a.mass - ball_b.mass) / total_mass) - 1.0) * a_dot_n
-        new_velocity_a = ball_a.velocity + contact_normal * scale
+        scale_a = 2.0 * mass_b / total_mass * b_dot_n
+        scale_a += (((mass_a - mass_b) / total_mass) - 1.0) * a_dot_n
         
-        scale = 2.0 * ball_a.mass / total_mass * a_dot_n
-        scale += (((ball_b.mass - ball_a.mass) / total_mass) - 1.0) * b_dot_n
-        new_velocity_b = ball_b.velocity + contact_normal * scale
+        scale_b = 2.0 * mass_a / total_mass * a_dot_n
+        scale_b += (((mass_b - mass_a) / total_mass) - 1.0) * b_dot_n
         
-        ball_a.velocity = new_velocity_a
-        ball_b.velocity = new_velocity_b
-
-        translate = contact_normal * ((ball_a.radius + ball_b.radius - (ball_b.position - ball_a.position).Length()) / 2.0)
+        half_depth = (ball_a.radius + ball_b.radius - distance) / 2.0
+        translate_x = normal_x * half_depth
+        translate_y = normal_y * half_depth
         
-        ball_a.position -= translate
-        ball_b.position += translate
\ No newline at end of file
+        self._write_ball_state(ball_a, ax - translate_x, ay - translate_y, avx + normal_x * scale_a, avy + normal_y * scale_a)
+        self._write_ball_state(ball_b, bx + translate_x, by + translate_y, bvx + normal_x * scale_b, bvy + normal_y * scale_b)
\ No newline at end of file
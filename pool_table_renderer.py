@@ -0,0 +1,110 @@
+# pool_table_renderer.py
+
+import math
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+class PoolTableRenderer(object):
+    # All OpenGL, PIL and texture state lives here so that the pool table itself
+    # can be simulated on machines that have no display at all.
+
+    def __init__(self):
+        self.texture_map = {}
+
+    def load_textures(self, number_list=range(0, 16)):
+        for number in number_list:
+            if number not in self.texture_map:
+                self.texture_map[number] = self._load_texture(number)
+
+    def release_textures(self):
+        for number in self.texture_map:
+            texture = self.texture_map[number]
+            if texture is not None:
+                try:
+                    glDeleteTextures([texture])
+                except Exception as ex:
+                    error = str(ex)
+        self.texture_map = {}
+
+    def _load_texture(self, number):
+        image = None
+        try:
+            from PIL import Image
+            import numpy
+
+            image_file = 'Textures/ball_%d.png' % number
+            image = Image.open(image_file).transpose(Image.FLIP_TOP_BOTTOM)
+            image_data = numpy.frombuffer(image.tobytes(), numpy.uint8)
+
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+            #glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, image.size[0], image.size[1], 0, GL_RGBA, GL_UNSIGNED_BYTE, image_data)
+
+            gluBuild2DMipmaps(GL_TEXTURE_2D, GL_RGBA, image.size[0], image.size[1], GL_RGBA, GL_UNSIGNED_BYTE, image_data)
+
+            return texture
+
+        except Exception as ex:
+            error = str(ex)
+            return None
+        finally:
+            if image is not None:
+                image.close()
+
+    def draw(self, pool_table):
+
+        # Draw the bumpers.
+        glBegin(GL_LINES)
+        try:
+            glColor3f(1.0, 1.0, 1.0)
+            for segment in pool_table.segment_list:
+                glVertex2f(segment.point_a.x, segment.point_a.y)
+                glVertex2f(segment.point_b.x, segment.point_b.y)
+        finally:
+            glEnd()
+
+        # Draw the pockets.
+        glColor3f(0.5, 0.5, 0.5)
+        for pocket in pool_table.pocket_list:
+            pocket.Render()
+
+        # Draw the balls.
+        for ball in pool_table.ball_list:
+            self.draw_ball(ball)
+
+    def draw_ball(self, ball, wire_frame=False):
+        texture = self.texture_map.get(ball.number)
+        if wire_frame or texture is None:
+            glBegin(GL_LINE_LOOP)
+            try:
+                sides = 12
+                for i in range(sides):
+                    angle = 2.0 * math.pi * (float(i) / float(sides))
+                    glVertex2f(ball.position.x + ball.radius * math.cos(angle), ball.position.y + ball.radius * math.sin(angle))
+            finally:
+                glEnd()
+        else:
+            glColor3f(1.0, 1.0, 1.0)
+            glEnable(GL_TEXTURE_2D)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glBegin(GL_QUADS)
+            try:
+                glTexCoord2f(0.0, 0.0)
+                glVertex2f(ball.position.x - ball.radius, ball.position.y - ball.radius)
+
+                glTexCoord2f(1.0, 0.0)
+                glVertex2f(ball.position.x + ball.radius, ball.position.y - ball.radius)
+
+                glTexCoord2f(1.0, 1.0)
+                glVertex2f(ball.position.x + ball.radius, ball.position.y + ball.radius)
+
+                glTexCoord2f(0.0, 1.0)
+                glVertex2f(ball.position.x - ball.radius, ball.position.y + ball.radius)
+            finally:
+                glEnd()
+                glDisable(GL_TEXTURE_2D)
\ No newline at end of file
@@ -0,0 +1,97 @@
+# profiler.py
+
+import time
+import collections
+
+class ProfileFrame(object):
+    # The counts and phase times gathered over one frame of simulation.
+
+    def __init__(self):
+        self.counter_map = {name: 0 for name in SimulationProfiler.COUNTER_LIST}
+        self.time_map = {name: 0.0 for name in SimulationProfiler.PHASE_LIST}
+        self.frame_time = 0.0
+
+class SimulationProfiler(object):
+    # Gathers per-frame counters and phase timings from a pool table's hot path.  Nothing
+    # is measured unless a profiler is attached to the table (pool_table.profiler), and when
+    # it isn't, the cost is a handful of None checks per substep.  A frame is whatever one
+    # call to advance_simulation, or to a simulator's advance, covers.  Completed frames are
+    # kept in a short history, along with the worst frame seen for each counter, so that a
+    # single pathological frame (say, the resolve loop spinning on a ball wedged in a pocket
+    # jaw) stands out even after it has scrolled out of the history.
+
+    PHASE_LIST = ['integrate', 'collide', 'pocket', 'friction']
+    COUNTER_LIST = ['substeps', 'resolve_iterations', 'pair_tests', 'cushion_tests', 'pocket_tests']
+
+    def __init__(self, history_size=120):
+        self.history = collections.deque(maxlen=history_size)
+        self.worst_frame_map = {}
+        self.frame = ProfileFrame()
+        self.frame_start_time = None
+        self.mark_time = None
+
+    def reset(self):
+        self.history.clear()
+        self.worst_frame_map = {}
+
+    def begin_frame(self):
+        self.frame = ProfileFrame()
+        self.frame_start_time = time.perf_counter()
+
+    def end_frame(self):
+        frame = self.frame
+        if self.frame_start_time is not None:
+            frame.frame_time = time.perf_counter() - self.frame_start_time
+            self.frame_start_time = None
+        self.history.append(frame)
+        for name, value in frame.counter_map.items():
+            worst_frame = self.worst_frame_map.get(name)
+            if worst_frame is None or value > worst_frame.counter_map[name]:
+                self.worst_frame_map[name] = frame
+        self.frame = ProfileFrame()
+
+    def begin_substep(self):
+        self.frame.counter_map['substeps'] += 1
+        self.mark_time = time.perf_counter()
+
+    def mark(self, phase):
+        # Charge the time since the last mark (or the start of the substep) to the phase.
+        now = time.perf_counter()
+        self.frame.time_map[phase] += now - self.mark_time
+        self.mark_time = now
+
+    def count(self, name, amount=1):
+        self.frame.counter_map[name] += amount
+
+    def last_frame(self):
+        if len(self.history) > 0:
+            return self.history[-1]
+
+    def worst_frame(self, name):
+        return self.worst_frame_map.get(name)
+
+    def average(self, name, frame_list=None):
+        # The average of a counter, of a phase time, or of the frame time over the frames in
+        # the history.  The history is copied first, since it may be read from another thread.
+        if frame_list is None:
+            frame_list = list(self.history)
+        if len(frame_list) == 0:
+            return 0.0
+        if name in SimulationProfiler.COUNTER_LIST:
+            total = sum(frame.counter_map[name] for frame in frame_list)
+        elif name == 'frame':
+            total = sum(frame.frame_time for frame in frame_list)
+        else:
+            total = sum(frame.time_map[name] for frame in frame_list)
+        return total / float(len(frame_list))
+
+    def format_lines(self):
+        # A few lines of text summarizing the history, for an on-screen overlay.
+        frame_list = list(self.history)
+        line_list = ['frame: %.3f ms avg' % (self.average('frame', frame_list) * 1000.0)]
+        line_list.append('  '.join('%s %.3f' % (phase, self.average(phase, frame_list) * 1000.0) for phase in self.PHASE_LIST) + ' ms')
+        for name in self.COUNTER_LIST:
+            worst_frame = self.worst_frame_map.get(name)
+            worst_count = 0 if worst_frame is None else worst_frame.counter_map[name]
+            line_list.append('%s: %.1f avg, %d worst' % (name.replace('_', ' '), self.average(name, frame_list), worst_count))
+        return line_list
@@ -0,0 +1,217 @@
+# shot_cache.py
+
+import math
+import json
+import array
+import hashlib
+import sqlite3
+import threading
+import collections
+
+from table_state import TableState
+from shot_result import ShotResult
+
+class ShotCacheStats(object):
+    __slots__ = ['hit_count', 'disk_hit_count', 'miss_count', 'eviction_count', 'entry_count', 'byte_count']
+
+    def __init__(self):
+        self.hit_count = 0
+        self.disk_hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+        self.entry_count = 0
+        self.byte_count = 0
+
+    def hit_rate(self):
+        total = self.hit_count + self.disk_hit_count + self.miss_count
+        return 0.0 if total == 0 else float(self.hit_count + self.disk_hit_count) / float(total)
+
+class ShotCache(object):
+    # Remembers the outcomes of simulated shots so that the same shot from the same layout
+    # is never simulated twice.  A shot is keyed by a hash of the table state, with every
+    # position and velocity rounded to a grid, of the cue velocity, also rounded, and of a
+    # tuple of whatever settings affect the outcome, so two layouts that differ by less than
+    # the grid share an outcome.  Outcomes are plain data (numbers, strings, lists and None,
+    # as made by a to_data method) and are kept encoded as JSON, which gives us their size,
+    # means that nobody can change a cached outcome by changing what they were handed, and
+    # means that reading a cache file back can never run any code.  The cache is least
+    # recently used first out, bounded both in entries and in bytes.  If a path is given,
+    # outcomes are also written through to an SQLite file there, and looked up in it
+    # whenever they're not in memory, so they survive from one run to the next and can be
+    # shared between processes.  It is safe to use from several threads.
+
+    def __init__(self, max_entries=4096, max_bytes=16 * 1024 * 1024, path=None, position_step=1e-4, velocity_step=1e-3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.position_step = position_step
+        self.velocity_step = velocity_step
+        self.entry_map = collections.OrderedDict()
+        self.stats = ShotCacheStats()
+        self.lock = threading.Lock()
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS shot (key TEXT PRIMARY KEY, value BLOB)')
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def make_key(self, state, cue_velocity_x, cue_velocity_y, config=()):
+        # The mode stored with the state plays no part in a shot, so it's left out.
+        data = state.data
+        quantized = array.array('q', [len(state.number_list)])
+        quantized.extend(state.number_list)
+        j = 1
+        for i in range(len(state.number_list)):
+            quantized.append(self._quantize(data[j], self.position_step))
+            quantized.append(self._quantize(data[j + 1], self.position_step))
+            quantized.append(self._quantize(data[j + 2], self.velocity_step))
+            quantized.append(self._quantize(data[j + 3], self.velocity_step))
+            quantized.append(1 if data[j + 4] != 0.0 else 0)
+            j += TableState.BALL_STRIDE
+        quantized.append(self._quantize(cue_velocity_x, self.velocity_step))
+        quantized.append(self._quantize(cue_velocity_y, self.velocity_step))
+        digest = hashlib.blake2b(quantized.tobytes(), digest_size=20)
+        digest.update(repr(config).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _quantize(self, value, step):
+        return int(math.floor(value / step + 0.5))
+
+    def get(self, key, decode=None):
+        # Returns a fresh copy of the cached outcome, or None if there is none.  If a decode
+        # function is given, such as ShotResult.from_data, the outcome is passed through it,
+        # and an outcome it can't make sense of counts as a miss.
+        with self.lock:
+            value_data = self.entry_map.get(key)
+            if value_data is not None:
+                value = self._decode(value_data, decode)
+                if value is not None:
+                    self.entry_map.move_to_end(key)
+                    self.stats.hit_count += 1
+                    return value
+            elif self.connection is not None:
+                row = self.connection.execute('SELECT value FROM shot WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    value_data = bytes(row[0])
+                    value = self._decode(value_data, decode)
+                    if value is not None:
+                        self._store(key, value_data)
+                        self.stats.disk_hit_count += 1
+                        return value
+            self.stats.miss_count += 1
+            return None
+
+    def put(self, key, value):
+        value_data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        with self.lock:
+            self._store(key, value_data)
+            if self.connection is not None:
+                self.connection.execute('INSERT OR REPLACE INTO shot (key, value) VALUES (?, ?)', (key, value_data))
+                self.connection.commit()
+
+    def _decode(self, value_data, decode):
+        try:
+            value = json.loads(value_data.decode('utf-8'))
+            return value if decode is None else decode(value)
+        except Exception as ex:
+            error = str(ex)
+            return None
+
+    def clear(self, clear_disk=False):
+        with self.lock:
+            self.entry_map.clear()
+            self.stats.entry_count = 0
+            self.stats.byte_count = 0
+            if clear_disk and self.connection is not None:
+                self.connection.execute('DELETE FROM shot')
+                self.connection.commit()
+
+    def _store(self, key, value_data):
+        stats = self.stats
+        old_value_data = self.entry_map.pop(key, None)
+        if old_value_data is not None:
+            stats.byte_count -= len(key) + len(old_value_data)
+        self.entry_map[key] = value_data
+        stats.byte_count += len(key) + len(value_data)
+        while len(self.entry_map) > 1 and (len(self.entry_map) > self.max_entries or stats.byte_count > self.max_bytes):
+            evicted_key, evicted_data = self.entry_map.popitem(last=False)
+            stats.byte_count -= len(evicted_key) + len(evicted_data)
+            stats.eviction_count += 1
+        stats.entry_count = len(self.entry_map)
+
+    def simulate_shot(self, pool_table, cue_velocity=None, simulator=None, **options):
+        # Just like pool_table.simulate_shot, including leaving the table in its final state,
+        # except that a shot that has been simulated before is not simulated again.
+        state = pool_table.save_state()
+        cue_velocity_x = cue_velocity_y = 0.0
+        if cue_velocity is not None:
+            cue_velocity_x, cue_velocity_y = cue_velocity.x, cue_velocity.y
+        config = shot_config(pool_table, simulator, options)
+        key = self.make_key(state, cue_velocity_x, cue_velocity_y, config)
+        entry = self.get(key, lambda value: (ShotResult.from_data(value[0]), _state_from_data(value[1])))
+        if entry is not None:
+            result, final_state = entry
+            pool_table.restore_state(final_state)
+            return result
+        result = pool_table.simulate_shot(cue_velocity, simulator=simulator, **options)
+        self.put(key, [result.to_data(), _state_to_data(pool_table.save_state())])
+        return result
+
+def _state_to_data(state):
+    return [list(state.number_list), list(state.data)]
+
+def _state_from_data(value):
+    number_list, data = value
+    state = TableState([int(number) for number in number_list])
+    if len(data) != len(state.data):
+        raise ValueError('Cached table state is the wrong size.')
+    state.data = array.array('d', [float(x) for x in data])
+    return state
+
+# The settings of a contact solver or a simulator that affect how a shot turns out.  Each
+# kind only has some of them, and the rest are left out.
+_SETTING_NAME_LIST = [
+    'velocity_iterations',
+    'position_iterations',
+    'restitution',
+    'correction',
+    'slop',
+    'decay_rate',
+    'rest_speed',
+    'max_events',
+    'approach_epsilon'
+]
+
+def _settings(instance):
+    if instance is None:
+        return None
+    setting_list = [type(instance).__name__]
+    for name in _SETTING_NAME_LIST:
+        if hasattr(instance, name):
+            setting_list.append((name, getattr(instance, name)))
+    return tuple(setting_list)
+
+def shot_config(pool_table, simulator=None, options=None):
+    # Everything other than the table state and the cue velocity that affects how a shot
+    # turns out, as a tuple that can go into a cache key.  The state only holds where the
+    # balls are and how they move, so each ball's size and weight go in here.
+    option_list = [] if options is None else sorted(options.items())
+    ball_layout = tuple((ball.number, ball.radius, ball.mass) for ball in pool_table.state_ball_list)
+    return (
+        type(pool_table).__name__,
+        ball_layout,
+        pool_table.pocket_radius,
+        pool_table.ball_radius,
+        pool_table.cue_ball_mass,
+        pool_table.other_ball_mass,
+        pool_table.friction,
+        pool_table.max_advance_distance,
+        _settings(pool_table.contact_solver),
+        _settings(simulator),
+        tuple(option_list)
+    )
@@ -0,0 +1,200 @@
+# shot_planner.py
+
+import math
+import time
+
+from math2d_vector import Vector
+
+def _point_segment_distance_squared(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    length_squared = dx * dx + dy * dy
+    t = 0.0
+    if length_squared > 0.0:
+        t = ((px - ax) * dx + (py - ay) * dy) / length_squared
+        t = 0.0 if t < 0.0 else (1.0 if t > 1.0 else t)
+    offset_x = ax + dx * t - px
+    offset_y = ay + dy * t - py
+    return offset_x * offset_x + offset_y * offset_y
+
+def _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+    def side(px, py, qx, qy, rx, ry):
+        return (qx - px) * (ry - py) - (qy - py) * (rx - px)
+    return (side(ax, ay, bx, by, cx, cy) > 0.0) != (side(ax, ay, bx, by, dx, dy) > 0.0) and \
+           (side(cx, cy, dx, dy, ax, ay) > 0.0) != (side(cx, cy, dx, dy, bx, by) > 0.0)
+
+def _segment_distance_squared(ax, ay, bx, by, cx, cy, dx, dy):
+    if _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+        return 0.0
+    return min(_point_segment_distance_squared(ax, ay, cx, cy, dx, dy),
+               _point_segment_distance_squared(bx, by, cx, cy, dx, dy),
+               _point_segment_distance_squared(cx, cy, ax, ay, bx, by),
+               _point_segment_distance_squared(dx, dy, ax, ay, bx, by))
+
+class PlannedShot(object):
+    # One candidate shot: the cue is to be struck at the given angle and speed to send the
+    # object ball into the pocket with the given index in pool_table.pocket_list.  The
+    # geometric score ranks candidates before anything is simulated; the result, once the
+    # shot has been simulated, is its ShotResult.
+
+    __slots__ = [
+        'angle',
+        'speed',
+        'object_ball',
+        'pocket_index',
+        'ghost_point',
+        'cut_angle',
+        'geometric_score',
+        'result'
+    ]
+
+    def __init__(self, angle, speed, object_ball, pocket_index, ghost_point, cut_angle, geometric_score):
+        self.angle = angle
+        self.speed = speed
+        self.object_ball = object_ball
+        self.pocket_index = pocket_index
+        self.ghost_point = ghost_point
+        self.cut_angle = cut_angle
+        self.geometric_score = geometric_score
+        self.result = None
+
+    def is_success(self):
+        return self.result is not None and not self.result.is_foul() and self.object_ball in self.result.pocketed_list
+
+    def rank_key(self):
+        # Shots that did what we wanted first, then any that pocketed something without a
+        # foul, then by how easy the geometry looks.
+        result = self.result
+        if result is None:
+            return (0, 0, 0, self.geometric_score)
+        return (2 if self.is_success() else 1, 0 if result.is_foul() else 1, len(result.object_balls_pocketed()), self.geometric_score)
+
+class ShotPlanner(object):
+    # Proposes shots for the cue ball by the ghost ball method: to send an object ball along
+    # a line into a pocket, the cue ball must arrive touching it on the far side of that
+    # line, at the ghost ball point.  For every object ball and pocket we work out the ghost
+    # ball point and the cut angle, and throw out any shot that cuts too thin, or where the
+    # cue ball's path to the ghost ball, or the object ball's path into the pocket, would
+    # run into another ball or a cushion.  That's all plain geometry and cheap.  Only the
+    # shots that survive are simulated, the most promising first, at each of a few speeds,
+    # for as long as the time budget allows.  The given table belongs to the planner; it is
+    # put back the way it was after planning.
+
+    def __init__(self, pool_table, speed_list=(3.0, 5.0, 8.0), max_cut_angle=math.radians(70.0), time_budget=0.5, max_time=20.0, simulator=None, shot_cache=None):
+        self.pool_table = pool_table
+        self.speed_list = speed_list
+        self.max_cut_angle = max_cut_angle
+        self.time_budget = time_budget
+        self.max_time = max_time
+        self.simulator = simulator
+        self.shot_cache = shot_cache
+        self.candidate_count = 0
+        self.simulated_count = 0
+
+    def plan(self, state=None, target_list=None, time_budget=None):
+        # Returns the planned shots, best first.  Shots that were simulated are ranked on how
+        # they turned out, and come before any that there wasn't time to simulate.  The
+        # optional target list limits which balls we try to pocket.
+        pool_table = self.pool_table
+        if state is not None:
+            pool_table.restore_state(state)
+        else:
+            state = pool_table.save_state()
+        if time_budget is None:
+            time_budget = self.time_budget
+        start_time = time.perf_counter()
+
+        candidate_list = self.find_candidates(target_list)
+        self.candidate_count = len(candidate_list)
+        self.simulated_count = 0
+        shot_list = []
+        try:
+            for speed in self.speed_list:
+                for candidate in candidate_list:
+                    shot = PlannedShot(candidate.angle, speed, candidate.object_ball, candidate.pocket_index, candidate.ghost_point, candidate.cut_angle, candidate.geometric_score)
+                    shot_list.append(shot)
+            # Try every candidate at the first speed before any at the next, so that a tight
+            # budget still covers as many different shots as it can.
+            for shot in shot_list:
+                if time.perf_counter() - start_time >= time_budget:
+                    break
+                pool_table.restore_state(state)
+                cue_velocity = Vector(radius=shot.speed, angle=shot.angle)
+                if self.shot_cache is not None:
+                    shot.result = self.shot_cache.simulate_shot(pool_table, cue_velocity, simulator=self.simulator, max_time=self.max_time)
+                else:
+                    shot.result = pool_table.simulate_shot(cue_velocity, max_time=self.max_time, simulator=self.simulator)
+                self.simulated_count += 1
+        finally:
+            pool_table.restore_state(state)
+        shot_list.sort(key=lambda shot: shot.rank_key(), reverse=True)
+        return shot_list
+
+    def find_candidates(self, target_list=None):
+        # Returns the shots that pass every geometric test, as planned shots without a speed,
+        # ordered by geometric score.
+        pool_table = self.pool_table
+        cue_ball = pool_table.find_cue_ball()
+        if cue_ball is None:
+            return []
+        radius = pool_table.ball_radius
+        cue_x = cue_ball.position.x
+        cue_y = cue_ball.position.y
+        ball_list = [ball for ball in pool_table.ball_list if ball is not cue_ball]
+        candidate_list = []
+        for object_ball in ball_list:
+            if target_list is not None and object_ball.number not in target_list:
+                continue
+            object_x = object_ball.position.x
+            object_y = object_ball.position.y
+            other_ball_list = [ball for ball in ball_list if ball is not object_ball]
+            for pocket_index, pocket in enumerate(pool_table.pocket_list):
+                # The object ball goes toward the pocket's center, and is in once its center
+                # crosses into the pocket, so that's as far as its path needs to be clear.
+                to_pocket_x = pocket.center.x - object_x
+                to_pocket_y = pocket.center.y - object_y
+                pocket_distance = math.sqrt(to_pocket_x * to_pocket_x + to_pocket_y * to_pocket_y)
+                if pocket_distance <= pocket.radius:
+                    continue
+                direction_x = to_pocket_x / pocket_distance
+                direction_y = to_pocket_y / pocket_distance
+                entry_x = pocket.center.x - direction_x * pocket.radius
+                entry_y = pocket.center.y - direction_y * pocket.radius
+
+                ghost_x = object_x - direction_x * 2.0 * radius
+                ghost_y = object_y - direction_y * 2.0 * radius
+                to_ghost_x = ghost_x - cue_x
+                to_ghost_y = ghost_y - cue_y
+                ghost_distance = math.sqrt(to_ghost_x * to_ghost_x + to_ghost_y * to_ghost_y)
+                if ghost_distance == 0.0:
+                    continue
+                cosine = (to_ghost_x * direction_x + to_ghost_y * direction_y) / ghost_distance
+                cut_angle = math.acos(max(-1.0, min(1.0, cosine)))
+                if cut_angle > self.max_cut_angle:
+                    continue
+
+                if not self._is_path_clear(object_x, object_y, entry_x, entry_y, radius, other_ball_list):
+                    continue
+                if not self._is_path_clear(cue_x, cue_y, ghost_x, ghost_y, radius, other_ball_list):
+                    continue
+
+                geometric_score = cosine / (1.0 + ghost_distance + pocket_distance)
+                angle = math.atan2(to_ghost_y, to_ghost_x)
+                candidate_list.append(PlannedShot(angle, None, object_ball.number, pocket_index, (ghost_x, ghost_y), cut_angle, geometric_score))
+        candidate_list.sort(key=lambda candidate: candidate.geometric_score, reverse=True)
+        return candidate_list
+
+    def _is_path_clear(self, start_x, start_y, end_x, end_y, radius, ball_list):
+        # Can a ball of the given radius roll straight from start to end without touching any
+        # of the given balls or any cushion?  A ball resting against a cushion is allowed to
+        # roll along it, hence the slight allowance there.
+        contact_distance_squared = 4.0 * radius * radius
+        for ball in ball_list:
+            position = ball.position
+            if _point_segment_distance_squared(position.x, position.y, start_x, start_y, end_x, end_y) < contact_distance_squared:
+                return False
+        cushion_distance_squared = (0.99 * radius) * (0.99 * radius)
+        for cushion in self.pool_table.cushion_list:
+            if _segment_distance_squared(start_x, start_y, end_x, end_y, cushion.ax, cushion.ay, cushion.bx, cushion.by) < cushion_distance_squared:
+                return False
+        return True
@@ -0,0 +1,84 @@
+# shot_result.py
+
+def _point_from_data(point):
+    if point is None:
+        return None
+    x, y = point
+    return (float(x), float(y))
+
+class ShotResult(object):
+    # A compact summary of one simulated shot.  Its record_event method is meant to be
+    # handed to the simulation directly as the event callback.
+
+    STOP_SETTLED = 'settled'
+    STOP_MAX_TIME = 'max_time'
+    STOP_CUE_BALL_POCKETED = 'cue_ball_pocketed'
+    STOP_FIRST_CONTACT = 'first_contact'
+    STOP_MAX_EVENTS = 'max_events'
+
+    __slots__ = [
+        'pocketed_list',
+        'first_contact',
+        'cue_ball_pocketed',
+        'ball_hit_count',
+        'bumper_hit_count',
+        'elapsed_time',
+        'stop_reason',
+        'cue_ball_position'
+    ]
+
+    def __init__(self):
+        self.pocketed_list = []
+        self.first_contact = None
+        self.cue_ball_pocketed = False
+        self.ball_hit_count = 0
+        self.bumper_hit_count = 0
+        self.elapsed_time = 0.0
+        self.stop_reason = None
+        self.cue_ball_position = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def to_data(self):
+        # As plain data for the shot cache, which from_data turns back into a result.
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_data(cls, data):
+        pocketed_list, first_contact, cue_ball_pocketed, ball_hit_count, bumper_hit_count, elapsed_time, stop_reason, cue_ball_position = data
+        result = cls()
+        result.pocketed_list = [int(number) for number in pocketed_list]
+        result.first_contact = None if first_contact is None else int(first_contact)
+        result.cue_ball_pocketed = bool(cue_ball_pocketed)
+        result.ball_hit_count = int(ball_hit_count)
+        result.bumper_hit_count = int(bumper_hit_count)
+        result.elapsed_time = float(elapsed_time)
+        result.stop_reason = None if stop_reason is None else str(stop_reason)
+        result.cue_ball_position = _point_from_data(cue_ball_position)
+        return result
+
+    def record_event(self, event, intensity, ball=None, other_ball=None):
+        if event == 'ball_hit_ball':
+            self.ball_hit_count += 1
+            if self.first_contact is None:
+                if ball.number == 0:
+                    self.first_contact = other_ball.number
+                elif other_ball.number == 0:
+                    self.first_contact = ball.number
+        elif event == 'ball_hit_bumper':
+            self.bumper_hit_count += 1
+        elif event == 'ball_in_pocket':
+            self.pocketed_list.append(ball.number)
+            if ball.number == 0:
+                self.cue_ball_pocketed = True
+
+    def is_foul(self):
+        return self.cue_ball_pocketed or self.first_contact is None
+
+    def object_balls_pocketed(self):
+        return [number for number in self.pocketed_list if number != 0]
\ No newline at end of file
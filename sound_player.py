@@ -0,0 +1,96 @@
+# sound_player.py
+
+import math
+import time
+
+from PyQt5 import QtCore, QtMultimedia
+
+class SoundPlayer(object):
+    # Plays the sounds for a frame's worth of simulation events.  Each sound has a small pool
+    # of preloaded voices, so a new hit doesn't cut off one still ringing, and its volume
+    # follows how hard the hit was.  A frame's events are coalesced to the loudest of each
+    # kind, and each kind is rate limited.  Hits too soft to hear are dropped, and so are
+    # repeats of the same hit between the same balls (or a ball and a cushion) that come
+    # closer together than the repeat interval, which is what a slow ball rolling along a
+    # cushion gives us.  If a sound can't be loaded, its events are just ignored.
+
+    SOUND_MAP = {
+        'ball_hit_ball': 'Sounds/ball_hit_ball.wav',
+        'ball_hit_bumper': 'Sounds/ball_hit_bumper.wav',
+        'ball_in_pocket': 'Sounds/ball_in_pocket.wav'
+    }
+
+    # The intensity, a speed, at which each sound plays at full volume.
+    FULL_VOLUME_MAP = {
+        'ball_hit_ball': 6.0,
+        'ball_hit_bumper': 4.0,
+        'ball_in_pocket': 2.0
+    }
+
+    def __init__(self, voice_count=4, min_interval=0.03, repeat_interval=0.25, min_intensity=0.05):
+        self.min_interval = min_interval
+        self.repeat_interval = repeat_interval
+        self.min_intensity = min_intensity
+        self.voice_map = {}
+        self.next_voice_map = {}
+        self.last_play_time_map = {}
+        self.last_hit_time_map = {}
+        for event, path in self.SOUND_MAP.items():
+            voice_list = []
+            try:
+                for i in range(voice_count):
+                    voice = QtMultimedia.QSoundEffect()
+                    voice.setSource(QtCore.QUrl.fromLocalFile(path))
+                    voice_list.append(voice)
+            except Exception as ex:
+                error = str(ex)
+                voice_list = []
+            self.voice_map[event] = voice_list
+            self.next_voice_map[event] = 0
+            self.last_play_time_map[event] = -float('inf')
+
+    def play_events(self, event_list, now=None):
+        # The events are (event, intensity, x, y, ball number, other ball number) tuples.
+        if len(event_list) == 0:
+            return
+        if now is None:
+            now = time.perf_counter()
+        loudest_map = {}
+        last_hit_time_map = self.last_hit_time_map
+        for event, intensity, x, y, number, other_number in event_list:
+            if intensity < self.min_intensity:
+                continue
+            # Every repeat counts, even a dropped one, so a contact that keeps going makes
+            # one sound rather than one every repeat interval.  The same two balls make the
+            # same key whichever way round they come; for a cushion or a pocket, the other
+            # number is -1, which sorts first.
+            key = (event, min(number, other_number), max(number, other_number))
+            last_hit_time = last_hit_time_map.get(key)
+            last_hit_time_map[key] = now
+            if number >= 0 and last_hit_time is not None and now - last_hit_time < self.repeat_interval:
+                continue
+            if intensity > loudest_map.get(event, -1.0):
+                loudest_map[event] = intensity
+        for event, intensity in loudest_map.items():
+            if now - self.last_play_time_map.get(event, -float('inf')) < self.min_interval:
+                continue
+            if self._play(event, intensity):
+                self.last_play_time_map[event] = now
+
+    def _play(self, event, intensity):
+        voice_list = self.voice_map.get(event)
+        if not voice_list:
+            return False
+        # Take a voice that has finished if there is one, or else the one started longest ago.
+        i = self.next_voice_map[event]
+        for j in range(len(voice_list)):
+            if not voice_list[(i + j) % len(voice_list)].isPlaying():
+                i = (i + j) % len(voice_list)
+                break
+        self.next_voice_map[event] = (i + 1) % len(voice_list)
+        voice = voice_list[i]
+        # Loudness goes roughly as the square root of the impact speed.
+        volume = math.sqrt(min(intensity / self.FULL_VOLUME_MAP.get(event, 1.0), 1.0))
+        voice.setVolume(volume)
+        voice.play()
+        return True
@@ -0,0 +1,127 @@
+# spatial_grid.py
+
+import math
+
+class SpatialGrid(object):
+    # A uniform grid hashing each ball by the cell containing its center.  As long as
+    # the cells are at least as wide as the largest ball diameter, two balls can only
+    # be touching if they are in the same or neighbouring cells.
+
+    # Each cell only pairs itself up with these neighbours so that a full sweep of the
+    # grid visits every pair of neighbouring cells exactly once.
+    FORWARD_NEIGHBOUR_LIST = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cell_map = {}
+        self.ball_cell_map = {}
+
+    def clear(self):
+        self.cell_map = {}
+        self.ball_cell_map = {}
+
+    def rebuild(self, ball_list):
+        self.clear()
+        max_radius = 0.0
+        for ball in ball_list:
+            if ball.radius > max_radius:
+                max_radius = ball.radius
+        if max_radius > 0.0:
+            self.cell_size = 2.0 * max_radius
+        for ball in ball_list:
+            self.insert(ball)
+
+    def _cell_key(self, position):
+        return int(math.floor(position.x / self.cell_size)), int(math.floor(position.y / self.cell_size))
+
+    def insert(self, ball):
+        key = self._cell_key(ball.position)
+        cell = self.cell_map.get(key)
+        if cell is None:
+            cell = []
+            self.cell_map[key] = cell
+        cell.append(ball)
+        self.ball_cell_map[ball] = key
+
+    def remove(self, ball):
+        key = self.ball_cell_map.pop(ball, None)
+        if key is not None:
+            cell = self.cell_map[key]
+            cell.remove(ball)
+            if len(cell) == 0:
+                del self.cell_map[key]
+
+    def update(self, ball):
+        key = self._cell_key(ball.position)
+        if self.ball_cell_map.get(ball) != key:
+            self.remove(ball)
+            self.insert(ball)
+
+    def yield_neighbours(self, ball):
+        i, j = self.ball_cell_map[ball]
+        for di in range(-1, 2):
+            for dj in range(-1, 2):
+                cell = self.cell_map.get((i + di, j + dj))
+                if cell is not None:
+                    for other_ball in cell:
+                        if other_ball is not ball:
+                            yield other_ball
+
+    def count_neighbours(self, ball):
+        # How many balls find_contacts_with would test against the given ball.
+        i, j = self.ball_cell_map[ball]
+        count = -1
+        for di in range(-1, 2):
+            for dj in range(-1, 2):
+                cell = self.cell_map.get((i + di, j + dj))
+                if cell is not None:
+                    count += len(cell)
+        return count
+
+    def count_pair_tests(self):
+        # How many pairs find_contacts would test.
+        count = 0
+        for key in self.cell_map:
+            cell_size = len(self.cell_map[key])
+            count += cell_size * (cell_size - 1) // 2
+            i, j = key
+            for di, dj in self.FORWARD_NEIGHBOUR_LIST:
+                other_cell = self.cell_map.get((i + di, j + dj))
+                if other_cell is not None:
+                    count += cell_size * len(other_cell)
+        return count
+
+    def find_contacts(self, epsilon=1e-7):
+        contact_list = []
+        for key in self.cell_map:
+            cell = self.cell_map[key]
+            for k in range(len(cell)):
+                ball_a = cell[k]
+                for l in range(k + 1, len(cell)):
+                    ball_b = cell[l]
+                    if balls_overlap(ball_a, ball_b, epsilon):
+                        contact_list.append((ball_a, ball_b))
+            i, j = key
+            for di, dj in self.FORWARD_NEIGHBOUR_LIST:
+                other_cell = self.cell_map.get((i + di, j + dj))
+                if other_cell is not None:
+                    for ball_a in cell:
+                        for ball_b in other_cell:
+                            if balls_overlap(ball_a, ball_b, epsilon):
+                                contact_list.append((ball_a, ball_b))
+        return contact_list
+
+    def find_contacts_with(self, ball, epsilon=1e-7):
+        contact_list = []
+        for other_ball in self.yield_neighbours(ball):
+            if balls_overlap(ball, other_ball, epsilon):
+                contact_list.append((ball, other_ball))
+        return contact_list
+
+def balls_overlap(ball_a, ball_b, epsilon=1e-7):
+    position_a = ball_a.position
+    position_b = ball_b.position
+    dx = position_b.x - position_a.x
+    dy = position_b.y - position_a.y
+    distance = ball_a.radius + ball_b.radius - epsilon
+    return dx * dx + dy * dy < distance * distance
\ No newline at end of file
@@ -0,0 +1,272 @@
+# table_batch.py
+
+import numpy
+
+from shot_result import ShotResult
+
+class TableBatch(object):
+    # Simulates many independent copies of one table in lockstep.  Ball state is kept in
+    # arrays shaped (tables, balls, 2), and every phase of a substep (integration, ball
+    # and bumper contacts, pocketing and friction) is a masked array operation across all
+    # of the tables at once.  This follows the same rules as PoolTable.advance_simulation,
+    # with each table choosing its own substeps, but tables that have settled drop out of
+    # the active set so that the work shrinks as shots finish.
+
+    def __init__(self, pool_table, table_count, settle_speed=1e-2, epsilon=1e-7, max_iterations=32):
+        ball_list = sorted(pool_table.ball_list + pool_table.pocketed_balls_list, key=lambda ball: ball.number)
+        ball_count = len(ball_list)
+
+        self.table_count = table_count
+        self.ball_count = ball_count
+        self.number_array = numpy.array([ball.number for ball in ball_list])
+        self.radius = numpy.array([ball.radius for ball in ball_list], dtype=float)
+        self.mass = numpy.array([ball.mass for ball in ball_list], dtype=float)
+        self.cue_index = None
+        for i, ball in enumerate(ball_list):
+            if ball.number == 0:
+                self.cue_index = i
+
+        self.position = numpy.empty((table_count, ball_count, 2))
+        self.position[:] = [[ball.position.x, ball.position.y] for ball in ball_list]
+        self.velocity = numpy.empty((table_count, ball_count, 2))
+        self.velocity[:] = [[ball.velocity.x, ball.velocity.y] for ball in ball_list]
+        self.on_table = numpy.empty((table_count, ball_count), dtype=bool)
+        self.on_table[:] = [not ball.pocketed for ball in ball_list]
+
+        self.cushion_a = numpy.array([[cushion.ax, cushion.ay] for cushion in pool_table.cushion_list])
+        self.cushion_direction = numpy.array([[cushion.dx, cushion.dy] for cushion in pool_table.cushion_list])
+        self.cushion_normal = numpy.array([[cushion.nx, cushion.ny] for cushion in pool_table.cushion_list])
+        self.cushion_length = numpy.array([cushion.length for cushion in pool_table.cushion_list])
+        cushion_index = pool_table.cushion_index
+        if self.radius.size > 0 and self.radius.max() > cushion_index.margin:
+            self.safe_min = self.safe_max = (0.0, 0.0)
+        else:
+            self.safe_min = (cushion_index.safe_min_x, cushion_index.safe_min_y)
+            self.safe_max = (cushion_index.safe_max_x, cushion_index.safe_max_y)
+        self.pocket_center = numpy.array([[pocket.center.x, pocket.center.y] for pocket in pool_table.pocket_list])
+        self.pocket_radius_squared = numpy.array([pocket.radius * pocket.radius for pocket in pool_table.pocket_list])
+
+        self.friction = pool_table.friction
+        self.max_advance_distance = pool_table.max_advance_distance
+        self.settle_speed = settle_speed
+        self.epsilon = epsilon
+        self.max_iterations = max_iterations
+
+        self.contact_limit = (self.radius[:, None] + self.radius[None, :] - epsilon) ** 2
+        self.pair_i, self.pair_j = numpy.triu_indices(ball_count, 1)
+        self.pair_limit = self.contact_limit[self.pair_i, self.pair_j]
+        self.bumper_limit = (self.radius - epsilon) ** 2
+
+        self.active = numpy.ones(table_count, dtype=bool)
+        self.settled = numpy.zeros(table_count, dtype=bool)
+        self.elapsed_time = numpy.zeros(table_count)
+        self.ball_hit_count = numpy.zeros(table_count, dtype=int)
+        self.bumper_hit_count = numpy.zeros(table_count, dtype=int)
+        self.first_contact = numpy.full(table_count, -1, dtype=int)
+        self.pocket_time = numpy.full((table_count, ball_count), numpy.inf)
+
+    def strike_cue_ball(self, cue_velocity):
+        # The cue velocity is either one (x, y) pair for every table, or one per table.
+        self.velocity[:, self.cue_index] += numpy.asarray(cue_velocity, dtype=float)
+        self.settled[:] = False
+        self.active[:] = True
+
+    def run(self, max_time=60.0, time_step=1.0 / 60.0):
+        self._update_settled()
+        while True:
+            self.active &= self.elapsed_time < max_time
+            if not self.active.any():
+                break
+            self.advance(time_step)
+
+    def advance(self, elapsed_time):
+        idx = numpy.flatnonzero(self.active)
+        if idx.size == 0:
+            return
+        position = self.position[idx]
+        velocity = self.velocity[idx]
+        on_table = self.on_table[idx]
+        remaining = numpy.full(idx.size, float(elapsed_time))
+
+        while idx.size > 0:
+            # Just as in advance_simulation, the fastest ball on each table decides how
+            # big a step that table can take without tunnelling.
+            speed = self._calc_max_speed(velocity, on_table)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                step = numpy.where(speed * remaining > self.max_advance_distance, self.max_advance_distance / speed, remaining)
+            self._advance_balls(idx, position, velocity, on_table, step)
+            self.elapsed_time[idx] += step
+            remaining -= step
+
+            done = remaining <= 1e-12
+            if done.any():
+                done_idx = idx[done]
+                self.position[done_idx] = position[done]
+                self.velocity[done_idx] = velocity[done]
+                self.on_table[done_idx] = on_table[done]
+                keep = ~done
+                idx = idx[keep]
+                position = position[keep]
+                velocity = velocity[keep]
+                on_table = on_table[keep]
+                remaining = remaining[keep]
+
+        self._update_settled()
+
+    def _update_settled(self):
+        idx = numpy.flatnonzero(self.active)
+        settled = self._calc_max_speed(self.velocity[idx], self.on_table[idx]) < self.settle_speed
+        self.settled[idx[settled]] = True
+        self.active[idx[settled]] = False
+
+    def _calc_max_speed(self, velocity, on_table):
+        speed_squared = numpy.einsum('tbk,tbk->tb', velocity, velocity)
+        speed_squared[~on_table] = 0.0
+        if speed_squared.shape[1] == 0:
+            return numpy.zeros(speed_squared.shape[0])
+        return numpy.sqrt(speed_squared.max(axis=1))
+
+    def _advance_balls(self, idx, position, velocity, on_table, step):
+        position += velocity * step[:, None, None]
+
+        # Only the tables that had something to resolve need to be looked at again.
+        rows = numpy.arange(idx.size)
+        for i in range(self.max_iterations):
+            ball_rows = self._resolve_ball_with_ball_collisions(rows, idx, position, velocity, on_table)
+            bumper_rows = self._resolve_ball_with_bumper_collisions(rows, idx, position, velocity, on_table)
+            rows = numpy.union1d(ball_rows, bumper_rows)
+            if rows.size == 0:
+                break
+
+        delta = position[:, :, None, :] - self.pocket_center[None, None, :, :]
+        distance_squared = numpy.einsum('tbpk,tbpk->tbp', delta, delta)
+        pocketed = (distance_squared < self.pocket_radius_squared).any(axis=2) & on_table
+        if pocketed.any():
+            t, b = numpy.nonzero(pocketed)
+            self.pocket_time[idx[t], b] = self.elapsed_time[idx[t]] + step[t]
+            on_table[pocketed] = False
+            velocity[pocketed] = 0.0
+
+        velocity *= self.friction
+
+    def _resolve_ball_with_ball_collisions(self, rows, idx, position, velocity, on_table):
+        # Returns the rows of the tables in which anything was resolved.
+        row_position = position[rows]
+        row_on_table = on_table[rows]
+        delta = row_position[:, self.pair_j] - row_position[:, self.pair_i]
+        distance_squared = numpy.einsum('tpk,tpk->tp', delta, delta)
+        overlap = (distance_squared < self.pair_limit) & row_on_table[:, self.pair_i] & row_on_table[:, self.pair_j]
+        pair_list = numpy.flatnonzero(overlap.any(axis=0))
+        if pair_list.size == 0:
+            return rows[:0]
+
+        # Pairs are resolved one after another, but each one across all of the tables
+        # where it was found overlapping at once.  Earlier pairs may have pushed these
+        # balls apart already, so the overlap is checked again before resolving.
+        for pair in pair_list:
+            i = self.pair_i[pair]
+            j = self.pair_j[pair]
+            t = rows[overlap[:, pair]]
+            normal = position[t, j] - position[t, i]
+            distance_squared = numpy.einsum('tk,tk->t', normal, normal)
+            still_overlapping = distance_squared < self.pair_limit[pair]
+            if not still_overlapping.all():
+                t = t[still_overlapping]
+                if t.size == 0:
+                    continue
+                normal = normal[still_overlapping]
+                distance_squared = distance_squared[still_overlapping]
+
+            length = numpy.sqrt(distance_squared)
+            normal /= numpy.where(length > 0.0, length, 1.0)[:, None]
+
+            mass_a = self.mass[i]
+            mass_b = self.mass[j]
+            total_mass = mass_a + mass_b
+            velocity_a = velocity[t, i]
+            velocity_b = velocity[t, j]
+            a_dot_n = numpy.einsum('tk,tk->t', velocity_a, normal)
+            b_dot_n = numpy.einsum('tk,tk->t', velocity_b, normal)
+            scale_a = 2.0 * mass_b / total_mass * b_dot_n + (((mass_a - mass_b) / total_mass) - 1.0) * a_dot_n
+            scale_b = 2.0 * mass_a / total_mass * a_dot_n + (((mass_b - mass_a) / total_mass) - 1.0) * b_dot_n
+            velocity[t, i] = velocity_a + normal * scale_a[:, None]
+            velocity[t, j] = velocity_b + normal * scale_b[:, None]
+
+            translate = normal * ((self.radius[i] + self.radius[j] - length) / 2.0)[:, None]
+            position[t, i] -= translate
+            position[t, j] += translate
+
+            table_idx = idx[t]
+            self.ball_hit_count[table_idx] += 1
+            if self.cue_index == i or self.cue_index == j:
+                other_number = self.number_array[j if self.cue_index == i else i]
+                first = table_idx[self.first_contact[table_idx] < 0]
+                self.first_contact[first] = other_number
+
+        return rows[overlap.any(axis=1)]
+
+    def _resolve_ball_with_bumper_collisions(self, rows, idx, position, velocity, on_table):
+        # Returns the rows of the tables in which anything was resolved.  Only balls outside
+        # of the cushion index's safe rectangle can be touching a bumper.
+        x = position[rows, :, 0]
+        y = position[rows, :, 1]
+        candidate = on_table[rows] & ~((x > self.safe_min[0]) & (x < self.safe_max[0]) & (y > self.safe_min[1]) & (y < self.safe_max[1]))
+        t, b = numpy.nonzero(candidate)
+        if t.size == 0:
+            return rows[:0]
+        t = rows[t]
+
+        ball_position = position[t, b]
+        relative = ball_position[:, None, :] - self.cushion_a[None, :, :]
+        along = numpy.einsum('hsk,sk->hs', relative, self.cushion_direction)
+        numpy.clip(along, 0.0, self.cushion_length, out=along)
+        closest = self.cushion_a[None, :, :] + self.cushion_direction[None, :, :] * along[..., None]
+        delta = ball_position[:, None, :] - closest
+        distance_squared = numpy.einsum('hsk,hsk->hs', delta, delta)
+        contact = distance_squared < self.bumper_limit[b][:, None]
+        contact_count = contact.sum(axis=1)
+        hit = contact_count > 0
+        if not hit.any():
+            return rows[:0]
+        t = t[hit]
+        b = b[hit]
+        contact = contact[hit]
+        contact_count = contact_count[hit]
+        closest = closest[hit]
+        ball_position = ball_position[hit]
+
+        # As in PoolTable, a ball touching several bumpers at once uses the average of
+        # their contact points and normals.
+        normal = numpy.einsum('hs,sk->hk', contact, self.cushion_normal)
+        normal /= numpy.sqrt(numpy.einsum('hk,hk->h', normal, normal))[:, None]
+        contact_point = numpy.einsum('hs,hsk->hk', contact, closest) / contact_count[:, None]
+
+        ball_velocity = velocity[t, b]
+        ball_velocity -= normal * (2.0 * numpy.einsum('hk,hk->h', ball_velocity, normal))[:, None]
+        velocity[t, b] = ball_velocity
+
+        offset = ball_position - contact_point
+        depth = self.radius[b] - numpy.sqrt(numpy.einsum('hk,hk->h', offset, offset))
+        position[t, b] = ball_position + normal * depth[:, None]
+
+        numpy.add.at(self.bumper_hit_count, idx[t], 1)
+        return numpy.unique(t)
+
+    def to_shot_results(self):
+        result_list = []
+        for k in range(self.table_count):
+            result = ShotResult()
+            pocketed = numpy.flatnonzero(numpy.isfinite(self.pocket_time[k]))
+            pocketed = pocketed[numpy.argsort(self.pocket_time[k, pocketed], kind='stable')]
+            result.pocketed_list = [int(self.number_array[b]) for b in pocketed]
+            result.cue_ball_pocketed = self.cue_index is not None and not self.on_table[k, self.cue_index]
+            if self.first_contact[k] >= 0:
+                result.first_contact = int(self.first_contact[k])
+            result.ball_hit_count = int(self.ball_hit_count[k])
+            result.bumper_hit_count = int(self.bumper_hit_count[k])
+            result.elapsed_time = float(self.elapsed_time[k])
+            result.stop_reason = ShotResult.STOP_SETTLED if self.settled[k] else ShotResult.STOP_MAX_TIME
+            if self.cue_index is not None and self.on_table[k, self.cue_index]:
+                result.cue_ball_position = tuple(float(x) for x in self.position[k, self.cue_index])
+            result_list.append(result)
+        return result_list
\ No newline at end of file
@@ -0,0 +1,58 @@
+# table_state.py
+
+import array
+import struct
+
+class TableState(object):
+    # A compact snapshot of a table's balls, stored in a single flat array of doubles with
+    # a fixed layout: the mode first, then x, y, vx, vy and a pocketed flag for each ball in
+    # order of ball number.  A state is allocated once and then written and read in place,
+    # so saving and restoring never allocate, and a state converts to and from bytes cheaply
+    # for shipping between processes.
+
+    BALL_STRIDE = 5
+    HEADER_FORMAT = '<I'
+
+    def __init__(self, number_list):
+        self.number_list = tuple(number_list)
+        self.data = array.array('d', bytes(8 * (1 + self.BALL_STRIDE * len(self.number_list))))
+
+    @property
+    def mode(self):
+        return int(self.data[0])
+
+    @mode.setter
+    def mode(self, value):
+        self.data[0] = value
+
+    def ball_offset(self, i):
+        return 1 + i * self.BALL_STRIDE
+
+    def copy(self):
+        state = TableState(self.number_list)
+        state.copy_from(self)
+        return state
+
+    def copy_from(self, state):
+        if state.number_list != self.number_list:
+            raise ValueError('Table states have different ball layouts.')
+        self.data[:] = state.data
+
+    def to_bytes(self):
+        header = struct.pack(self.HEADER_FORMAT, len(self.number_list))
+        return header + array.array('i', self.number_list).tobytes() + self.data.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        offset = struct.calcsize(cls.HEADER_FORMAT)
+        if len(data) < offset:
+            raise ValueError('Table state data is too short.')
+        count, = struct.unpack_from(cls.HEADER_FORMAT, data)
+        if len(data) != offset + 4 * count + 8 * (1 + cls.BALL_STRIDE * count):
+            raise ValueError('Table state data is the wrong size for %d balls.' % count)
+        number_array = array.array('i')
+        number_array.frombytes(data[offset:offset + 4 * count])
+        state = cls(number_array)
+        state.data = array.array('d')
+        state.data.frombytes(data[offset + 4 * count:])
+        return state
\ No newline at end of file
@@ -0,0 +1,214 @@
+# texture_manager.py
+
+import os
+import threading
+import numpy
+
+from OpenGL.GL import *
+
+# The ball sprites are decoded once per process, into an atlas with all of its mip levels
+# already made, and that atlas is kept on disk next to the sprites so that later runs
+# don't have to decode anything at all.  The GL texture made from it is shared by every
+# renderer that asks for it, so resetting or recreating a table never touches the disk.
+
+ATLAS_COLUMNS = 4
+CACHE_FILE = 'Textures/atlas_cache.npz'
+CELL_CORNER_ARRAY = numpy.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]], dtype=numpy.float32)
+
+def _next_power_of_two(size):
+    power = 1
+    while power < size:
+        power *= 2
+    return power
+
+def _build_mip_level_list(image_data):
+    # Box-filter each level down to the next, all the way to a single texel.
+    level_list = [image_data]
+    while image_data.shape[0] > 1 or image_data.shape[1] > 1:
+        height = max(image_data.shape[0] // 2, 1)
+        width = max(image_data.shape[1] // 2, 1)
+        data = image_data.astype(numpy.uint16)
+        if image_data.shape[0] > 1:
+            data = data[0::2] + data[1::2]
+        else:
+            data = data * 2
+        if image_data.shape[1] > 1:
+            data = data[:, 0::2] + data[:, 1::2]
+        else:
+            data = data * 2
+        image_data = ((data + 2) // 4).astype(numpy.uint8).reshape((height, width, 4))
+        level_list.append(image_data)
+    return level_list
+
+class TextureAtlas(object):
+    # The decoded atlas: its mip levels, largest first, and the texture coordinates of
+    # the four corners of each ball's cell, indexed by ball number.
+
+    def __init__(self, number_list, level_list, texcoord_array):
+        self.number_list = list(number_list)
+        self.level_list = level_list
+        self.texcoord_array = texcoord_array
+
+    @classmethod
+    def decode(cls, number_list, path_format='Textures/ball_%d.png'):
+        from PIL import Image
+
+        # Every cell is the size of the largest sprite; the rows of the atlas go up the
+        # texture, which is the same way the flipped sprites go.
+        image_list = []
+        for number in number_list:
+            image = Image.open(path_format % number)
+            try:
+                image_list.append(numpy.asarray(image.convert('RGBA').transpose(Image.FLIP_TOP_BOTTOM), dtype=numpy.uint8))
+            finally:
+                image.close()
+        cell_height = max(image_data.shape[0] for image_data in image_list)
+        cell_width = max(image_data.shape[1] for image_data in image_list)
+        rows = (len(image_list) + ATLAS_COLUMNS - 1) // ATLAS_COLUMNS
+        width = _next_power_of_two(cell_width * ATLAS_COLUMNS)
+        height = _next_power_of_two(cell_height * rows)
+
+        atlas_data = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+        texcoord_array = numpy.zeros((max(number_list) + 1, 4, 2), dtype=numpy.float32)
+        for i, image_data in enumerate(image_list):
+            x = (i % ATLAS_COLUMNS) * cell_width
+            y = (i // ATLAS_COLUMNS) * cell_height
+            atlas_data[y:y + image_data.shape[0], x:x + image_data.shape[1]] = image_data
+
+            # Keep half a texel in from the edge of the cell so that filtering never
+            # picks up the neighbouring sprite.
+            u_min = (x + 0.5) / width
+            v_min = (y + 0.5) / height
+            u_size = (image_data.shape[1] - 1.0) / width
+            v_size = (image_data.shape[0] - 1.0) / height
+            texcoord_array[number_list[i]] = CELL_CORNER_ARRAY * (u_size, v_size) + (u_min, v_min)
+
+        return cls(number_list, _build_mip_level_list(atlas_data), texcoord_array)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as archive:
+            level_count = int(archive['level_count'])
+            level_list = [archive['level_%d' % i] for i in range(level_count)]
+            return cls(archive['number_list'].tolist(), level_list, archive['texcoord_array'])
+
+    def save(self, path):
+        array_map = {'level_%d' % i: level for i, level in enumerate(self.level_list)}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as handle:
+            numpy.savez(handle, level_count=len(self.level_list), number_list=numpy.array(self.number_list), texcoord_array=self.texcoord_array, **array_map)
+        os.replace(temp_path, path)
+
+class TextureManager(object):
+    # Loads the ball atlas on a background thread, from the cache if it is newer than all
+    # of the sprites or else by decoding them (and then writing the cache), and makes the
+    # GL texture from it on the first call to atlas_texture after it is ready.  That call
+    # must come from the thread that owns the GL context, and returns None until then, so
+    # nothing on the drawing thread ever waits on the disk.
+
+    def __init__(self, number_list=range(0, 16), path_format='Textures/ball_%d.png', cache_file=CACHE_FILE):
+        self.number_list = list(number_list)
+        self.path_format = path_format
+        self.cache_file = cache_file
+        self.atlas = None
+        self.texture = None
+        self.error = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start_loading(self):
+        with self.lock:
+            if self.thread is None and self.atlas is None:
+                self.thread = threading.Thread(target=self._load_atlas, daemon=True)
+                self.thread.start()
+
+    def wait(self):
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def is_loading(self):
+        return self.thread is not None
+
+    def has_failed(self):
+        return self.error is not None
+
+    def is_pending(self):
+        # True until the texture has been made, or it has failed; drawing should carry on
+        # until then so that the atlas shows up as soon as it's ready.
+        return self.error is None and self.texture is None and (self.thread is not None or self.atlas is not None)
+
+    def _cache_is_current(self):
+        try:
+            cache_time = os.path.getmtime(self.cache_file)
+            for number in self.number_list:
+                if os.path.getmtime(self.path_format % number) > cache_time:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def _load_atlas(self):
+        atlas = None
+        try:
+            if self._cache_is_current():
+                try:
+                    atlas = TextureAtlas.load(self.cache_file)
+                    if atlas.number_list != self.number_list:
+                        atlas = None
+                except Exception as ex:
+                    error = str(ex)
+                    atlas = None
+            if atlas is None:
+                atlas = TextureAtlas.decode(self.number_list, self.path_format)
+                try:
+                    atlas.save(self.cache_file)
+                except Exception as ex:
+                    error = str(ex)
+        except Exception as ex:
+            self.error = str(ex)
+        finally:
+            self.atlas = atlas
+            self.thread = None
+
+    def atlas_texture(self):
+        if self.texture is None and self.atlas is not None and self.error is None:
+            self.texture = self._upload(self.atlas)
+        return self.texture
+
+    def texcoord_array(self):
+        return None if self.atlas is None else self.atlas.texcoord_array
+
+    def _upload(self, atlas):
+        try:
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(atlas.level_list) - 1)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            for level, image_data in enumerate(atlas.level_list):
+                glTexImage2D(GL_TEXTURE_2D, level, GL_RGBA, image_data.shape[1], image_data.shape[0], 0, GL_RGBA, GL_UNSIGNED_BYTE, image_data)
+            return texture
+        except Exception as ex:
+            self.error = str(ex)
+            return None
+
+    def release(self):
+        # Only call this when the GL context itself is going away.
+        if self.texture is not None:
+            try:
+                glDeleteTextures([self.texture])
+            except Exception as ex:
+                error = str(ex)
+            self.texture = None
+
+_shared_texture_manager = None
+
+def get_texture_manager():
+    global _shared_texture_manager
+    if _shared_texture_manager is None:
+        _shared_texture_manager = TextureManager()
+    return _shared_texture_manager
@@ -0,0 +1,162 @@
+# trajectory_recorder.py
+
+import mmap
+import struct
+
+from table_state import TableState
+
+# The file starts with a header, followed by the ball numbers, followed by nothing but
+# fixed-size frame records.  Each record holds the frame time, a count and the strongest
+# intensity of each kind of event seen during the frame, the quantized position and
+# velocity of every ball, and a bit mask of the pocketed balls.  Fixed-size records mean
+# that any frame can be found without reading the ones before it.
+
+MAGIC = b'BTRJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHHff')
+EVENT_LIST = ['ball_hit_ball', 'ball_hit_bumper', 'ball_in_pocket']
+
+# Positions are stored in units of 1/10000, which covers the table with room to spare,
+# and velocities in units of 1/2048, which covers anything up to 16 units per second.
+POSITION_SCALE = 10000.0
+VELOCITY_SCALE = 2048.0
+
+def _record_struct(ball_count):
+    mask_size = (ball_count + 7) // 8
+    return struct.Struct('<d3H3f%dh%ds' % (4 * ball_count, mask_size))
+
+def _quantize(value, scale):
+    value = int(round(value * scale))
+    if value > 32767:
+        return 32767
+    if value < -32768:
+        return -32768
+    return value
+
+class TrajectoryRecorder(object):
+    # Streams one record per frame to an append-only file.  Records are packed into a
+    # reused buffer and written through a buffered file, so recording costs little more
+    # than taking a snapshot of the table, and nothing is held in memory.  Pass
+    # record_event along as (or from) the simulation's event callback.
+
+    def __init__(self, path, pool_table, buffer_size=1 << 16):
+        self.pool_table = pool_table
+        self.state = pool_table.save_state()
+        self.ball_count = len(self.state.number_list)
+        self.record = _record_struct(self.ball_count)
+        self.buffer = bytearray(self.record.size)
+        self.value_list = [0] * (7 + 4 * self.ball_count)
+        self._reset_events()
+
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.ball_count, POSITION_SCALE, VELOCITY_SCALE))
+        self.file.write(struct.pack('<%dh' % self.ball_count, *self.state.number_list))
+        self.frame_count = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _reset_events(self):
+        self.event_count_map = {event: 0 for event in EVENT_LIST}
+        self.event_intensity_map = {event: 0.0 for event in EVENT_LIST}
+
+    def record_event(self, event, intensity, ball=None, other_ball=None):
+        if event in self.event_count_map:
+            self.event_count_map[event] += 1
+            if intensity > self.event_intensity_map[event]:
+                self.event_intensity_map[event] = intensity
+
+    def record_frame(self, time):
+        state = self.pool_table.save_state(self.state)
+        data = state.data
+        value_list = self.value_list
+        value_list[0] = time
+        for k, event in enumerate(EVENT_LIST):
+            value_list[1 + k] = min(self.event_count_map[event], 65535)
+            value_list[4 + k] = self.event_intensity_map[event]
+
+        mask = 0
+        j = 1
+        k = 7
+        for i in range(self.ball_count):
+            value_list[k] = _quantize(data[j], POSITION_SCALE)
+            value_list[k + 1] = _quantize(data[j + 1], POSITION_SCALE)
+            value_list[k + 2] = _quantize(data[j + 2], VELOCITY_SCALE)
+            value_list[k + 3] = _quantize(data[j + 3], VELOCITY_SCALE)
+            if data[j + 4] != 0.0:
+                mask |= 1 << i
+            j += TableState.BALL_STRIDE
+            k += 4
+
+        mask_bytes = mask.to_bytes((self.ball_count + 7) // 8, 'little')
+        self.record.pack_into(self.buffer, 0, *value_list, mask_bytes)
+        self.file.write(self.buffer)
+        self._reset_events()
+        self.frame_count += 1
+
+class TrajectoryReader(object):
+    # Memory-maps a recording so that frames can be read in any order without loading
+    # the whole file.
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.ball_count, self.position_scale, self.velocity_scale = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a trajectory recording: %s' % path)
+        self.number_list = struct.unpack_from('<%dh' % self.ball_count, self.map, HEADER.size)
+        self.record = _record_struct(self.ball_count)
+        self.frame_offset = HEADER.size + 2 * self.ball_count
+        self.frame_count = (len(self.map) - self.frame_offset) // self.record.size
+        self.state = TableState(self.number_list)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def read_time(self, i):
+        return struct.unpack_from('<d', self.map, self.frame_offset + i * self.record.size)[0]
+
+    def find_frame(self, time):
+        # Binary search for the last frame at or before the given time.
+        low = 0
+        high = self.frame_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.read_time(middle) <= time:
+                low = middle + 1
+            else:
+                high = middle
+        return max(low - 1, 0)
+
+    def read_frame(self, i, state=None):
+        # Decode frame i into a table state (the reader's own, unless one is given), and
+        # return the frame time, that state, and a list of (event, count, intensity).
+        if state is None:
+            state = self.state
+        value_list = self.record.unpack_from(self.map, self.frame_offset + i * self.record.size)
+        event_list = []
+        for k, event in enumerate(EVENT_LIST):
+            if value_list[1 + k] > 0:
+                event_list.append((event, value_list[1 + k], value_list[4 + k]))
+
+        mask = int.from_bytes(value_list[-1], 'little')
+        data = state.data
+        j = 1
+        k = 7
+        for b in range(self.ball_count):
+            data[j] = value_list[k] / self.position_scale
+            data[j + 1] = value_list[k + 1] / self.position_scale
+            data[j + 2] = value_list[k + 2] / self.velocity_scale
+            data[j + 3] = value_list[k + 3] / self.velocity_scale
+            data[j + 4] = 1.0 if mask & (1 << b) else 0.0
+            j += TableState.BALL_STRIDE
+            k += 4
+        return value_list[0], state, event_list
+
+    def apply_frame(self, i, pool_table):
+        time, state, event_list = self.read_frame(i)
+        pool_table.restore_state(state)
+        return time, event_list
\ No newline at end of file
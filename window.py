@@ -18,9 +18,13 @@ class Window(QtWidgets.QMainWindow):
     def is_key_down(self, key):
         return self.key_map.get(key, False)
     
+    def is_any_key_down(self):
+        return any(self.key_map.values())
+    
     def keyPressEvent(self, event):
         key = event.key()
         self.key_map[key] = True
+        self.canvas.wake()
         self.canvas.key_strike(event.key())
     
     def keyReleaseEvent(self, event):
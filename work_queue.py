@@ -0,0 +1,24 @@
+# work_queue.py
+
+import heapq
+
+class WorkQueue(object):
+    # A priority queue of work items that are ordered by a key, where pushing an item whose
+    # key is already pending does nothing.  Keys must be unique per item and orderable.
+
+    def __init__(self):
+        self.heap = []
+        self.pending_set = set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, key, item):
+        if key not in self.pending_set:
+            self.pending_set.add(key)
+            heapq.heappush(self.heap, (key, item))
+
+    def pop(self):
+        key, item = heapq.heappop(self.heap)
+        self.pending_set.remove(key)
+        return item
\ No newline at end of file